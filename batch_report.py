@@ -0,0 +1,104 @@
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from json import load
+from typing import Tuple, Dict, Iterable, Optional
+
+from pydantic import BaseModel
+
+import measurements
+from latex_build import build_pdf, ENGINE_ARGS
+from latex_utils import Document, Content, ZeroSkipHeader, MeasurePageSetup, MeasureTitlePage, \
+    ContentItem, CtxBuffer, render_to_file
+from meas_render import MeasureDescriptor, format_legend
+from report_builder import measure_place_blocks
+from sonel_db import ConnectionPool
+
+PACKAGES = ('longtable', 'xcolor', 'graphicx', 'svg', 'pdfpages', 'pdflscape')
+
+
+class ReportJob(BaseModel):
+    output: str  # tex file
+    nodes: Tuple[int, ...]  # nodes with measured places as children
+    descriptors: Tuple[str, ...]  # class names from measurements
+    setup: MeasurePageSetup
+    wykonawca: str = '.'
+    landscape: bool = False
+
+
+def _prerender(v: ContentItem) -> str:
+    # same line ends as rendering into file
+    b = CtxBuffer('\n')
+    b.put(v)
+    return b.value
+
+
+def _get_descriptor(name: str) -> MeasureDescriptor:
+    descr_type = getattr(measurements, name, None)
+    if not (isinstance(descr_type, type) and issubclass(descr_type, MeasureDescriptor)):
+        raise ValueError(f'Unknown measure descriptor {name}')
+    return descr_type()
+
+
+def _job_document(pool: ConnectionPool, job: ReportJob, preamble: str, legends: Dict[str, str]) -> Document:
+    descriptors = tuple(map(_get_descriptor, job.descriptors))
+    blocks = measure_place_blocks(
+        pool, job.nodes, descriptors, landscape=job.landscape, legends=legends
+    )
+    setup = job.setup
+    return Document(
+        packages=PACKAGES,
+        header=Content(preamble, setup),
+        body=Content(
+            MeasureTitlePage(
+                ce_data=setup.ce_data, firma=setup.firma, data_pomiarow=setup.data_pomiarow,
+                wykonawca=job.wykonawca, miejsce=setup.miejsce, pomiarowcy=setup.pomiarowcy,
+            ),
+            *blocks
+        ),
+    )
+
+
+def run_jobs(
+        db_fname: str, jobs: Iterable[ReportJob], threads: int = 4,
+        processes: Optional[int] = None, pdf: bool = False, engine_args: Tuple[str, ...] = ENGINE_ARGS
+):
+    """
+    Database is opened once for all jobs, static preamble and legends are rendered once,
+    documents are rendered (and compiled with `engine_args`) in worker processes
+    """
+    jobs = tuple(jobs)
+    preamble = _prerender(ZeroSkipHeader())
+    legends = {
+        name: _prerender(Content(*format_legend(_get_descriptor(name))))
+        for name in set(name for job in jobs for name in job.descriptors)
+    }
+
+    with ConnectionPool(db_fname, threads) as pool:
+        documents = tuple(_job_document(pool, job, preamble, legends) for job in jobs)
+
+    outputs = tuple(job.output for job in jobs)
+    with ProcessPoolExecutor(processes) as executor:
+        build = partial(build_pdf, engine_args=engine_args) if pdf else render_to_file
+        tuple(executor.map(build, documents, outputs))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Generate measurement protocols for list of jobs')
+    parser.add_argument('db', help='Sonel database file')
+    parser.add_argument('jobs', help='json file with list of jobs')
+    parser.add_argument('--threads', type=int, default=4, help='database connections')
+    parser.add_argument('--processes', type=int, default=None, help='rendering processes')
+    parser.add_argument('--pdf', action='store_true', help='compile documents with pdflatex')
+    parser.add_argument(
+        '--shell-escape', action='store_true', help='run pdflatex with -shell-escape, needed by svg of title page'
+    )
+    args = parser.parse_args()
+
+    with open(args.jobs) as f:
+        jobs_data = load(f)
+    run_jobs(
+        args.db, (ReportJob(**job) for job in jobs_data),
+        threads=args.threads, processes=args.processes, pdf=args.pdf,
+        engine_args=ENGINE_ARGS + (('-shell-escape',) if args.shell_escape else ())
+    )
@@ -0,0 +1,44 @@
+from random import Random
+from sys import argv
+from time import perf_counter
+from typing import Dict, Any
+
+from latex_utils import CtxBuffer
+from meas_render import MeasureDescriptor, format_measure_table
+from measurements import PetlaZwarciaTNS, TestRCDta, RezystancjaIzolacji
+
+
+def _random_rows(measure_descr: MeasureDescriptor, n_rows: int, seed: int = 0) -> Dict[str, Dict[str, Any]]:
+    rnd = Random(seed)
+    rows = {}
+    for i in range(n_rows):
+        if isinstance(measure_descr, PetlaZwarciaTNS):
+            row = dict(
+                fuse_model='S301', fuse_characteristics=rnd.choice('BC'),
+                In=16., Ia=80., Zs=rnd.uniform(.3, 3.),
+            )
+        elif isinstance(measure_descr, TestRCDta):
+            row = dict(
+                rcd_model='AC', In_mA=30., ta=40e-3, trcd=rnd.uniform(.01, .05),
+                UI=50., UB=rnd.uniform(.5, 2.), RE=10.,
+            )
+        else:
+            row = dict(R_LPE=rnd.uniform(1e8, 1e9), R_LN=rnd.uniform(1e8, 1e9), R_a=250e6)
+        rows[f'Obwód {i + 1}'] = row
+    return rows
+
+
+def bench_render(measure_descr: MeasureDescriptor, n_rows: int) -> float:
+    """
+    Table rows formatted and rendered per second
+    """
+    rows = _random_rows(measure_descr, n_rows)
+    start = perf_counter()
+    format_measure_table(measure_descr, rows).render(CtxBuffer())
+    return n_rows / (perf_counter() - start)
+
+
+if __name__ == '__main__':
+    n_rows = int(argv[1]) if len(argv) > 1 else 10000
+    for descr in (PetlaZwarciaTNS(), TestRCDta(), RezystancjaIzolacji()):
+        print(f'{type(descr).__name__}: {bench_render(descr, n_rows):.0f} rows/s')
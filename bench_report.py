@@ -0,0 +1,154 @@
+from argparse import ArgumentParser
+from datetime import datetime
+from json import dumps, loads
+from os.path import exists, join
+from subprocess import run
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict, Tuple, Iterable, Optional, Callable, Any
+
+from pysqlite3 import Cursor
+
+from latex_utils import CtxBuffer
+from meas_render import MeasureDescriptor, get_measure_data, compute_all_rows, format_measure_table
+from measurements import PetlaZwarciaTNS, TestRCDta, RezystancjaIzolacji, TestRCD
+from replicate import fill_for_node
+from sonel_db import connect_database, prepare_database
+from sonel_sql import query_tree_children
+from sonel_synth import SynthConfig, generate_database
+
+DESCRIPTORS = (PetlaZwarciaTNS(), TestRCDta(), RezystancjaIzolacji(), TestRCD())
+
+
+def _best_time(fn: Callable[[], Any], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        fn()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def measured_parents(cur: Cursor) -> Tuple[int, ...]:
+    cur.execute(
+        'SELECT DISTINCT idParentNode FROM Tree WHERE idNode IN (SELECT idNode FROM Measurement) ORDER BY idParentNode'
+    )
+    return tuple(node_id for node_id, in cur.fetchall())
+
+
+def bench_pipeline(
+        cur: Cursor, descriptors: Iterable[MeasureDescriptor] = DESCRIPTORS,
+        node_ids: Optional[Iterable[int]] = None, repeat: int = 3
+) -> Dict[str, float]:
+    """
+    Best of `repeat` times [s] of report stages for all nodes by `stage:descriptor`,
+    each stage gets output of the previous one prepared outside of timing
+    """
+    node_ids = tuple(node_ids) if node_ids is not None else measured_parents(cur)
+    children = tuple(tuple(query_tree_children(cur, (node_id,))) for node_id in node_ids)
+    results = {}
+    for descr in descriptors:
+        name = type(descr).__name__
+
+        def extract():
+            return tuple(
+                get_measure_data(cur, places, descr.measure_ids, descr.required_properties)
+                for places in children
+            )
+
+        def compute():
+            return tuple(compute_all_rows(descr, data) for data in extracted)
+
+        def fill():
+            return tuple(fill_for_node(cur, node_id, descr, seed=0) for node_id in filled_ids)
+
+        def render():
+            b = CtxBuffer('\n')
+            for node_rows in rows:
+                if node_rows:
+                    format_measure_table(descr, node_rows).render(b)
+
+        extracted = extract()
+        rows = compute()
+        # nodes without measurements of descriptor have nothing to sample from
+        filled_ids = tuple(node_id for node_id, data in zip(node_ids, extracted) if data)
+        results[f'get_measure_data:{name}'] = _best_time(extract, repeat)
+        results[f'compute_rows:{name}'] = _best_time(compute, repeat)
+        results[f'fill_for_node:{name}'] = _best_time(fill, repeat)
+        results[f'render:{name}'] = _best_time(render, repeat)
+    return results
+
+
+def _revision() -> str:
+    try:
+        return run(('git', 'rev-parse', '--short', 'HEAD'), capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def append_history(fname: str, results: Dict[str, float], info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Appends json line with results, returns previous record of the same benchmark setup (`info`)
+    """
+    info = loads(dumps(info))  # compared with records read back from json
+    previous = None
+    if exists(fname):
+        with open(fname) as f:
+            for line in f:
+                try:
+                    record = loads(line)
+                except ValueError:  # other output in the same file
+                    continue
+                if isinstance(record, dict) and record.get('info') == info:
+                    previous = record
+    with open(fname, 'a') as f:
+        f.write(dumps(dict(
+            time=datetime.now().isoformat(timespec='seconds'), revision=_revision(), info=info, results=results
+        )) + '\n')
+    return previous
+
+
+def format_results(results: Dict[str, float], previous: Optional[Dict[str, Any]] = None) -> str:
+    previous_results = previous['results'] if previous is not None else {}
+    lines = []
+    for key, seconds in results.items():
+        line = f'{key:40s} {seconds * 1e3:10.2f} ms'
+        if key in previous_results:
+            line += f' {(seconds / previous_results[key] - 1) * 100:+7.1f}%'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Time report pipeline stages on synthetic or given Sonel database')
+    parser.add_argument('--db', default=None, help='existing database, synthetic one is generated when not given')
+    parser.add_argument('--buildings', type=int, default=10)
+    parser.add_argument('--floors', type=int, default=0)
+    parser.add_argument('--places', type=int, default=50)
+    parser.add_argument('--history', type=int, default=3)
+    parser.add_argument('--prepare', action='store_true', help='benchmark copy with indexes (sonel_db.prepare_database)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--history-file', default='bench_output.txt', help='json lines with results of all runs')
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmp_dir:
+        if args.db is None:
+            config = SynthConfig(
+                buildings=args.buildings, floors=args.floors, places=args.places, history=args.history
+            )
+            db_fname = join(tmp_dir, 'synth.db')
+            generate_database(db_fname, config)
+            bench_info = dict(synth=dict(config), prepare=args.prepare)
+        else:
+            db_fname = args.db
+            bench_info = dict(db=args.db, prepare=args.prepare)
+        if args.prepare:
+            prepare_database(db_fname, join(tmp_dir, 'prepared.db'))
+            db_fname = join(tmp_dir, 'prepared.db')
+
+        conn = connect_database(db_fname, read_only=True)
+        bench_results = bench_pipeline(conn.cursor(), repeat=args.repeat)
+        conn.close()
+
+    previous_record = append_history(args.history_file, bench_results, bench_info)
+    print(format_results(bench_results, previous_record))
@@ -0,0 +1,50 @@
+from typing import Dict, Tuple
+
+from numpy import ndarray, array, asarray, broadcast_arrays, full, nan, isin, searchsorted, minimum, where
+
+# instantaneous tripping of circuit breakers, upper limit of magnetic range as multiple of In (IEC 60898)
+MCB_MULTIPLIERS: Dict[str, float] = {'B': 5., 'C': 10., 'D': 20.}
+
+GG_NAMES = ('gG', 'gL', 'gL/gG')
+
+# gG fuse links, approximate currents causing disconnection within given time [s] by rated current [A],
+# typical values read from time-current characteristics, manufacturer data should be preferred
+GG_TRIP_CURRENTS: Dict[float, Dict[float, float]] = {
+    0.4: {6: 28, 10: 46, 16: 82, 20: 119, 25: 162, 32: 210, 40: 284, 50: 397, 63: 520},
+    5.: {6: 16, 10: 28, 16: 50, 20: 72, 25: 90, 32: 120, 40: 157, 50: 218, 63: 280, 80: 370, 100: 508},
+}
+
+# tables as sorted arrays, searched for whole columns at once
+_GG_ARRAYS: Dict[float, Tuple[ndarray, ndarray]] = {
+    time: (array(sorted(table), dtype=float), array([table[k] for k in sorted(table)], dtype=float))
+    for time, table in GG_TRIP_CURRENTS.items()
+}
+
+
+def trip_current(characteristics, In, disconnection_time: float = 0.4) -> ndarray:
+    """
+    Current Ia [A] disconnecting protection within `disconnection_time`, for single values or columns
+    of characteristics (B, C, D, gG) and rated currents In [A]. NaN for unknown characteristics and ratings
+    """
+    if disconnection_time not in _GG_ARRAYS:
+        raise ValueError(f'No fuse tables for disconnection time {disconnection_time} s')
+    chars, In = broadcast_arrays(asarray(characteristics, dtype=object), asarray(In, dtype=float))
+    Ia = full(In.shape, nan)
+
+    for char, multiplier in MCB_MULTIPLIERS.items():
+        mask = chars == char
+        Ia[mask] = multiplier * In[mask]
+
+    ratings, currents = _GG_ARRAYS[disconnection_time]
+    mask = isin(chars, GG_NAMES)
+    gg_In = In[mask]
+    i = minimum(searchsorted(ratings, gg_In), len(ratings) - 1)
+    Ia[mask] = where(ratings[i] == gg_In, currents[i], nan)
+    return Ia
+
+
+def loop_impedance_limit(characteristics, In, disconnection_time: float = 0.4, U0: float = 230.) -> ndarray:
+    """
+    Required loop impedance Za = U0 / Ia [Ohm]
+    """
+    return U0 / trip_current(characteristics, In, disconnection_time)
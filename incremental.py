@@ -0,0 +1,138 @@
+from json import dumps, loads
+from typing import Tuple, Dict, Any, Iterable
+
+from pysqlite3 import connect, Cursor
+
+from meas_render import MeasureDescriptor, get_measure_data, compute_all_rows
+from sonel_sql import Tree
+
+
+def _place_key(place: Tree):
+    # same keys as returned by get_measure_data
+    return place.name or place.idNode
+
+
+def _descriptor_key(measure_descr: MeasureDescriptor) -> str:
+    # options changing computed rows (like disconnection time) are part of the key
+    options = ",".join(
+        f'{k}={v}' for k, v in sorted(dict(measure_descr).items())
+        if k not in ('title', 'measure_ids', 'required_properties')
+    )
+    return f'{type(measure_descr).__name__}:{",".join(measure_descr.measure_ids)}:{options}'
+
+
+def query_fingerprints(
+        cur: Cursor, places: Tuple[Tree, ...], measure_types: Tuple[str, ...]
+) -> Dict[int, str]:
+    """
+    Identify measurements selected by get_measure_data for each node,
+    fingerprint changes when new measurement is added or place is renamed
+    """
+    place_ids_list = ", ".join(map(str, (place.idNode for place in places)))
+    measure_types_list = ", ".join(f'"{m}"' for m in measure_types)
+    selected = {}
+    for node_id, meas_type, meas_id, date_time in cur.execute(
+            f'SELECT idNode, typeMeasurement, idMeasurement, dateTime FROM Measurement '
+            f'WHERE idNode IN ({place_ids_list}) AND typeMeasurement IN ({measure_types_list}) AND evaluate = "Correct" '
+            f'ORDER BY dateTime ASC'
+    ):
+        selected[(node_id, meas_type)] = (meas_type, meas_id, str(date_time))
+
+    meas_by_node = {}
+    for (node_id, _), meas in selected.items():
+        meas_by_node.setdefault(node_id, []).append(meas)
+
+    places_by_ids = {place.idNode: place for place in places}
+    return {
+        node_id: dumps([place.name, place.shortName, sorted(meas)])
+        for node_id, meas in meas_by_node.items()
+        for place in (places_by_ids[node_id],)
+    }
+
+
+class RowCache:
+    """
+    Computed rows persisted between report builds
+    """
+
+    def __init__(self, path: str):
+        self._conn = connect(path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS NodeRow ('
+            'descriptor TEXT, idNode INTEGER, fingerprint TEXT, row TEXT, '
+            'PRIMARY KEY (descriptor, idNode))'
+        )
+
+    def load(self, descriptor: str, node_ids: Iterable[int]) -> Dict[int, Tuple[str, Dict[str, Any]]]:
+        node_ids_list = ", ".join(map(str, node_ids))
+        return {
+            node_id: (fingerprint, loads(row))
+            for node_id, fingerprint, row in self._conn.execute(
+                f'SELECT idNode, fingerprint, row FROM NodeRow '
+                f'WHERE descriptor = ? AND idNode IN ({node_ids_list})', (descriptor,)
+            )
+        }
+
+    def store(self, descriptor: str, rows: Iterable[Tuple[int, str, Dict[str, Any]]]):
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO NodeRow (descriptor, idNode, fingerprint, row) VALUES (?, ?, ?, ?)',
+            ((descriptor, node_id, fingerprint, dumps(row)) for node_id, fingerprint, row in rows)
+        )
+        self._conn.commit()
+
+    def remove(self, descriptor: str, node_ids: Iterable[int]):
+        node_ids_list = ", ".join(map(str, node_ids))
+        self._conn.execute(
+            f'DELETE FROM NodeRow WHERE descriptor = ? AND idNode IN ({node_ids_list})', (descriptor,)
+        )
+        self._conn.commit()
+
+    def clear(self):
+        self._conn.execute('DELETE FROM NodeRow')
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def compute_rows_incremental(
+        cur: Cursor, cache: RowCache, places: Tuple[Tree, ...], measure_descr: MeasureDescriptor
+) -> Dict[str, Dict[str, Any]]:
+    """
+    compute_row output for places with measurements,
+    only nodes with changed measurements are queried and recomputed
+    """
+    descriptor = _descriptor_key(measure_descr)
+    fingerprints = query_fingerprints(cur, places, measure_descr.measure_ids)
+    cached = cache.load(descriptor, (place.idNode for place in places))
+
+    changed = tuple(
+        place for place in places
+        if place.idNode in fingerprints
+        and cached.get(place.idNode, (None,))[0] != fingerprints[place.idNode]
+    )
+    cache.remove(descriptor, (
+        node_id for node_id in cached if node_id not in fingerprints
+    ))
+
+    rows = {
+        node_id: row for node_id, (_, row) in cached.items()
+        if node_id in fingerprints
+    }
+    if changed:
+        computed_rows = compute_all_rows(
+            measure_descr, get_measure_data(
+                cur, changed, measure_descr.measure_ids, measure_descr.required_properties
+            )
+        )
+        computed = tuple(
+            (place.idNode, fingerprints[place.idNode], computed_rows[_place_key(place)])
+            for place in changed
+        )
+        cache.store(descriptor, computed)
+        rows.update((node_id, row) for node_id, _, row in computed)
+
+    return {
+        _place_key(place): rows[place.idNode]
+        for place in places if place.idNode in rows
+    }
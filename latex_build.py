@@ -0,0 +1,78 @@
+from filecmp import cmp
+from os import listdir, remove, replace
+from os.path import dirname, basename, join, exists, splitext, getmtime
+from re import compile
+from subprocess import run
+from typing import Iterable, Tuple, Optional
+
+from latex_utils import ContentItem, Ctx, FragmentInput
+
+# includesvg needs '-shell-escape', pass it explicitly only for trusted documents
+ENGINE_ARGS = ('-interaction=nonstopmode', '-halt-on-error')
+
+_INPUT_RE = compile(r'\\input\{([^}]*)\}')
+
+
+def fragments_directory(tex_fname: str) -> str:
+    """
+    Default fragments directory of a document, relative to main tex file and not shared with other documents
+    """
+    return f'{splitext(basename(tex_fname))[0]}-fragments'
+
+
+def fragment_inputs(
+        items: Iterable[ContentItem], tex_fname: str, directory: Optional[str] = None
+) -> Tuple[FragmentInput, ...]:
+    """
+    Wraps document sections (place blocks, attachments) into fragment files next to main tex file
+    """
+    root = dirname(tex_fname) or '.'
+    directory = directory or fragments_directory(tex_fname)
+    return tuple(FragmentInput(item, directory, root) for item in items)
+
+
+def _clean_fragments(tex_fname: str, directory: str):
+    # fragments not referenced by main file, the directory belongs to this document only
+    fragments_dir = join(dirname(tex_fname), directory)
+    if not exists(fragments_dir):
+        return
+    used = set()
+    with open(tex_fname) as f:
+        for line in f:
+            used.update(basename(name) for name in _INPUT_RE.findall(line))
+    for fname in listdir(fragments_dir):
+        name, ext = splitext(fname)
+        if ext == '.tex' and name not in used:
+            remove(join(fragments_dir, fname))
+
+
+def build_pdf(
+        document: ContentItem, tex_fname: str, engine: str = 'pdflatex',
+        engine_args: Tuple[str, ...] = ENGINE_ARGS, runs: int = 2,
+        directory: Optional[str] = None
+) -> bool:
+    """
+    Writes main tex file and runs LaTeX engine only when the document changed,
+    fragment names are content hashes so any change in a fragment changes main file.
+    Returns True when the engine was run. `directory` has to be the one given to fragment_inputs
+    """
+    new_fname = f'{tex_fname}.new'
+    with open(new_fname, 'w') as f:
+        Ctx(f).put(document)
+
+    pdf_fname = f'{splitext(tex_fname)[0]}.pdf'
+    if exists(tex_fname) and exists(pdf_fname) and getmtime(pdf_fname) >= getmtime(tex_fname) \
+            and cmp(new_fname, tex_fname, shallow=False):
+        remove(new_fname)
+        return False
+
+    replace(new_fname, tex_fname)
+    _clean_fragments(tex_fname, directory or fragments_directory(tex_fname))
+
+    for _ in range(runs):  # second run resolves page references (LastPage)
+        run(
+            (engine,) + tuple(engine_args) + (basename(tex_fname),),
+            cwd=dirname(tex_fname) or '.', check=True
+        )
+    return True
+
@@ -1,24 +1,91 @@
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import contextmanager
 from datetime import datetime
-from typing import Union, Iterable, Tuple, Optional, List
+from functools import wraps
+from hashlib import sha1
+from io import StringIO
+from itertools import repeat
+from os import makedirs, replace, remove, getpid
+from os.path import join, exists
+from typing import Union, Iterable, Tuple, Optional, List, TextIO, Sequence
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel
 
 from sonel_sql import Tree
 
-ContentItem = Union[str, 'LatexObject', Tuple]
+
+class LatexObject:
+    """
+    Lightweight node, fields are declared in __slots__ and set by __init__
+    """
+    __slots__ = ()
+
+    def render(self, ctx: 'Ctx'):
+        raise NotImplementedError('render not implemented')
+
+    def __eq__(self, other):
+        return type(self) is type(other) and _field_values(self) == _field_values(other)
+
+    # unhashable, fields hold lists and lazy row iterables which compare by value but can change
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ', '.join(
+            f'{k}={v!r}' for k, v in zip(_slot_names(type(self)), _field_values(self))
+        )
+        return f'{type(self).__name__}({fields})'
+
+    # nodes are accepted as values of pydantic model fields without validation
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        from pydantic_core import core_schema
+        return core_schema.is_instance_schema(cls)
+
+    @classmethod
+    def __get_validators__(cls):  # pydantic v1
+        yield cls._validate
+
+    @classmethod
+    def _validate(cls, v):
+        if not isinstance(v, cls):
+            raise TypeError(f'{cls.__name__} expected')
+        return v
+
+
+ContentItem = Union[str, LatexObject, Tuple]
 
 def get_ce_date(date):
     _, m, y = date.split('.')
     return f'{int(m):02d}/{y}'
 
-def _field_factory(default):
-    return Field(default_factory=lambda: default)
-
 class Ctx:
+    """
+    Writes rendered LaTeX straight into output stream, every printed part is followed by `end`
+    """
+
+    def __init__(self, out: Optional[TextIO] = None, end: str = '\n'):
+        self._out = out if out is not None else sys.stdout
+        self._end = end
+
     # TODO: text with escape ?
     def _print(self, s: str):
-        print(s)
+        self._out.write(str(s))
+        self._out.write(self._end)
+
+    @contextmanager
+    def inline(self):
+        """
+        Nested content is written without line ends, the whole fragment is ended once
+        """
+        end = self._end
+        self._end = ''
+        try:
+            yield self
+        finally:
+            self._end = end
+        self._out.write(end)
 
     def put(self, v: ContentItem):
         if isinstance(v, LatexObject):
@@ -36,6 +103,15 @@ class Ctx:
         self._print('\\\\')
         return self
 
+    def put_row(self, cells: Sequence[str]):
+        """
+        Table row of already rendered cells written with one join, the same output as putting cells one by one
+        """
+        end = self._end
+        self._out.write(f'{end} & {end}'.join(cells))
+        self._out.write(f'{end}\\\\{end}')
+        return self
+
     def cmd(self, p, *args, **params):
         c = f'\\{p}'
         if params:
@@ -58,23 +134,39 @@ class Ctx:
 
 
 class CtxBuffer(Ctx):
-    def __init__(self):
-        self._txt = ''
-
-    def _print(self, s: str):
-        self._txt += s
+    def __init__(self, end: str = ''):
+        super().__init__(StringIO(), end)
 
     @property
     def value(self):
-        return self._txt
+        return self._out.getvalue()
 
 
-class LatexObject(BaseModel):
-    def render(self, ctx: Ctx):
-        raise NotImplementedError('render not implemented')
+class LatexModel(BaseModel, LatexObject):
+    """
+    Validated node for document configuration, not used for table content
+    """
+
+
+_slot_names_by_type = {}
+
+
+def _slot_names(cls) -> Tuple[str, ...]:
+    names = _slot_names_by_type.get(cls)
+    if names is None:
+        names = _slot_names_by_type[cls] = tuple(
+            name for c in reversed(cls.__mro__) for name in c.__dict__.get('__slots__', ())
+        )
+    return names
+
+
+def _field_values(v: LatexObject) -> Tuple:
+    if isinstance(v, BaseModel):
+        return tuple(v.__dict__.values())
+    return tuple(getattr(v, name) for name in _slot_names(type(v)))
 
 
-class Document(LatexObject):
+class Document(LatexModel):
     document_class: str = 'article'
     header: Optional[ContentItem] = None
     title: str = ''
@@ -117,12 +209,88 @@ def _render_to_str(v: ContentItem) -> str:
         return str(v)
 
 
+def _put_inline(ctx: Ctx, v: ContentItem):
+    # same output as _render_to_str but written directly into ctx
+    if isinstance(v, LatexObject):
+        v.render(ctx)
+    else:
+        ctx._print(str(v))
+
+
+def render_to_file(v: ContentItem, fname: str):
+    with open(fname, 'w') as f:
+        Ctx(f).put(v)
+
+
+class FragmentCache:
+    """
+    Bounded LRU of rendered inline fragments
+    """
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._fragments = OrderedDict()
+
+    def get(self, key) -> Optional[str]:
+        fragment = self._fragments.get(key)
+        if fragment is not None:
+            self._fragments.move_to_end(key)
+        return fragment
+
+    def put(self, key, fragment: str):
+        self._fragments[key] = fragment
+        if len(self._fragments) > self.max_size:
+            self._fragments.popitem(last=False)
+
+    def clear(self):
+        self._fragments.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+def _fragment_key(v):
+    # objects are identified by values, raises TypeError for unhashable values
+    if isinstance(v, str):
+        return v
+    if isinstance(v, LatexObject):
+        return (type(v),) + tuple(map(_fragment_key, _field_values(v)))
+    if isinstance(v, (List, Tuple)):
+        return (type(v),) + tuple(map(_fragment_key, v))
+    hash(v)
+    return type(v), v
+
+
+def _cached_fragment(render):
+    """
+    Caches output of inline render method, repeated cells cost a single lookup
+    """
+
+    @wraps(render)
+    def cached_render(self, ctx: Ctx):
+        try:
+            key = _fragment_key(self)
+            fragment = fragment_cache.get(key)
+        except TypeError:
+            return render(self, ctx)
+        if fragment is None:
+            b = CtxBuffer()
+            render(self, b)
+            fragment = b.value
+            fragment_cache.put(key, fragment)
+        ctx._print(fragment)
+
+    return cached_render
+
+
 class HLine(LatexObject):
+    __slots__ = ()
+
     def render(self, ctx: Ctx):
         ctx.put('\\noindent\\rule{\\textwidth}{1pt}')
 
 
-class IncludeFile(LatexObject):
+class IncludeFile(LatexModel):
     fname: str
 
     def render(self, ctx: Ctx):
@@ -130,10 +298,10 @@ class IncludeFile(LatexObject):
 
 
 class Content(LatexObject):
-    items: Iterable[ContentItem] = ()
+    __slots__ = ('items',)
 
-    def __init__(self, *items, **kwargs):
-        super().__init__(items=tuple(items), **kwargs)
+    def __init__(self, *items: ContentItem):
+        self.items = items
 
     def render(self, ctx: Ctx):
         for item in self.items:
@@ -141,21 +309,25 @@ class Content(LatexObject):
 
 
 class Center(Content):
+    __slots__ = ()
+
     def render(self, ctx: Ctx):
         with ctx.begin('center'):
             super().render(ctx)
 
 class Landscape(Content):
+    __slots__ = ()
+
     def render(self, ctx: Ctx):
         with ctx.begin('landscape'):
             super().render(ctx)
 
 
 class DotList(LatexObject):
-    items: Iterable[ContentItem] = ()
+    __slots__ = ('items',)
 
-    def __init__(self, *items):
-        super().__init__(items=tuple(items))
+    def __init__(self, *items: ContentItem):
+        self.items = items
 
     def render(self, ctx: Ctx):
         with ctx.begin('itemize'):
@@ -164,6 +336,8 @@ class DotList(LatexObject):
 
 
 class ZeroSkipHeader(LatexObject):
+    __slots__ = ()
+
     def render(self, ctx: Ctx):
         ctx.put('''
 \\usepackage{etoolbox}
@@ -179,7 +353,11 @@ class ZeroSkipHeader(LatexObject):
 
 
 class Box(Content):
-    width: float = 1.
+    __slots__ = ('width',)
+
+    def __init__(self, *items: ContentItem, width: float = 1.):
+        super().__init__(*items)
+        self.width = width
 
     def render(self, ctx: Ctx):
         ctx.put(f'\\parbox{{{self.width}\\textwidth}}{{')
@@ -188,6 +366,8 @@ class Box(Content):
 
 
 class TextBox(Content):
+    __slots__ = ()
+
     def render(self, ctx: Ctx):
         ctx.put('\\fbox{\\parbox{\\textwidth}{')
         super().render(ctx)
@@ -195,54 +375,86 @@ class TextBox(Content):
 
 
 class ItemContainer(LatexObject):
-    i: ContentItem
+    __slots__ = ('i',)
 
     def __init__(self, i: ContentItem):
-        super().__init__(i=i)
+        self.i = i
 
     def render(self, ctx: Ctx):
         ctx.put(self.i)
 
 
 class Math(ItemContainer):
+    __slots__ = ()
+
+    @_cached_fragment
     def render(self, ctx: Ctx):
-        ctx.put(f'${{{_render_to_str(self.i)}}}$')
+        with ctx.inline():
+            ctx._print('${')
+            _put_inline(ctx, self.i)
+            ctx._print('}$')
 
 
 class Bold(ItemContainer):
+    __slots__ = ()
+
+    @_cached_fragment
     def render(self, ctx: Ctx):
-        ctx.put(f'\\textbf{{{_render_to_str(self.i)}}}')
+        with ctx.inline():
+            ctx._print('\\textbf{')
+            _put_inline(ctx, self.i)
+            ctx._print('}')
 
 
 class Color(LatexObject):
-    color: str
-    text: ContentItem
+    __slots__ = ('color', 'text')
+
+    def __init__(self, color: str, text: ContentItem):
+        self.color = color
+        self.text = text
 
+    @_cached_fragment
     def render(self, ctx: Ctx):
-        ctx.put(f'\\textcolor{{{self.color}}}{{{_render_to_str(self.text)}}}')
+        with ctx.inline():
+            ctx._print(f'\\textcolor{{{self.color}}}{{')
+            _put_inline(ctx, self.text)
+            ctx._print('}')
 
 
 class MultiLine(LatexObject):
-    items: Tuple[ContentItem, ...]
+    __slots__ = ('items',)
 
-    def __init__(self, *items):
-        super().__init__(items=tuple(items))
+    def __init__(self, *items: ContentItem):
+        self.items = items
 
+    @_cached_fragment
     def render(self, ctx: Ctx):
-        content = ''.join(
-            f'\\hbox{{\\strut {_render_to_str(v)}}}'
-            for v in self.items
-        )
-        ctx.put(f'\\vtop{{{content}}}')
+        with ctx.inline():
+            ctx._print('\\vtop{')
+            for v in self.items:
+                ctx._print('\\hbox{\\strut ')
+                _put_inline(ctx, v)
+                ctx._print('}')
+            ctx._print('}')
 
 
 class LongTable(LatexObject):
-    caption: ContentItem = ''
-    first_header: Optional[ContentItem] = None
-    columns: Tuple[ContentItem, ...] = ()
-    foot: ContentItem = _field_factory(Content('\\hline'))
-    last_foot: ContentItem = _field_factory(Content('\\hline'))
-    rows: Iterable[Tuple[ContentItem, ...]] = ()
+    __slots__ = ('caption', 'first_header', 'columns', 'foot', 'last_foot', 'rows', 'formatted')
+
+    def __init__(
+            self, caption: ContentItem = '', first_header: Optional[ContentItem] = None,
+            columns: Tuple[ContentItem, ...] = (),
+            foot: Optional[ContentItem] = None, last_foot: Optional[ContentItem] = None,
+            rows: Iterable[Tuple[ContentItem, ...]] = (),
+            formatted: Iterable[Sequence[Sequence[str]]] = ()
+    ):
+        self.caption = caption
+        self.first_header = first_header
+        self.columns = tuple(columns)
+        self.foot = foot if foot is not None else Content('\\hline')
+        self.last_foot = last_foot if last_foot is not None else Content('\\hline')
+        self.rows = rows  # not copied, rows are pulled while rendering
+        self.formatted = formatted  # chunks of pre-formatted columns of cell strings, rendered after rows
 
     def _render_columns(self, ctx: Ctx):
         if self.columns:
@@ -286,9 +498,77 @@ class LongTable(LatexObject):
 
             for row in self.rows:
                 self._render_row(ctx, row)
+            for columns in self.formatted:
+                for cells in zip(*columns):
+                    ctx.put_row(cells)
+
+
+def _render_fragment(v: ContentItem, end: str) -> str:
+    b = CtxBuffer(end)
+    b.put(v)
+    return b.value
+
+
+class ParallelContent(Content):
+    """
+    Items are rendered in worker processes and written in order,
+    they have to be picklable (no generators inside)
+    """
+    __slots__ = ('processes',)
+
+    def __init__(self, *items: ContentItem, processes: Optional[int] = None):
+        super().__init__(*items)
+        self.processes = processes
+
+    def render(self, ctx: Ctx):
+        with ProcessPoolExecutor(self.processes) as executor:
+            for fragment in executor.map(_render_fragment, self.items, repeat(ctx._end)):
+                ctx._out.write(fragment)
+
+
+class _HashingWriter:
+    def __init__(self, out: TextIO):
+        self._out = out
+        self.hash = sha1()
+
+    def write(self, s: str):
+        self._out.write(s)
+        self.hash.update(s.encode())
+
 
+class FragmentInput(LatexObject):
+    """
+    Item is written into separate file named by hash of its content and included with \\input,
+    unchanged fragments are not written again
+    """
+    __slots__ = ('item', 'directory', 'root')
 
-class Images(LatexObject):
+    def __init__(self, item: ContentItem, directory: str = 'fragments', root: str = '.'):
+        self.item = item
+        self.directory = directory  # relative to main tex file
+        self.root = root  # directory of main tex file
+
+    def render(self, ctx: Ctx):
+        # streamed into temporary file and hashed on the way, content is never held in memory
+        directory = join(self.root, self.directory)
+        makedirs(directory, exist_ok=True)
+        tmp_fname = join(directory, f'.{getpid()}-{id(self)}.tmp')
+        try:
+            with open(tmp_fname, 'w') as f:
+                writer = _HashingWriter(f)
+                Ctx(writer, ctx._end).put(self.item)
+
+            name = writer.hash.hexdigest()[:16]
+            fname = join(directory, f'{name}.tex')
+            if not exists(fname):
+                replace(tmp_fname, fname)
+        finally:
+            if exists(tmp_fname):  # rendering failed or fragment already written
+                remove(tmp_fname)
+        ctx.cmd('input', f'{self.directory}/{name}')
+
+
+class Images(LatexModel):
     images: Tuple[str, ...]
     scale: float = 1.
 
@@ -300,7 +580,7 @@ class Images(LatexObject):
             ctx.cmd('includegraphics', im, scale=self.scale)
 
 
-class PDF(LatexObject):
+class PDF(LatexModel):
     pages: Optional[Tuple[int, ...]] = None
     file: str
 
@@ -316,7 +596,11 @@ class PDF(LatexObject):
 
 
 class Attachment(Content):
-    name: ContentItem = '.'
+    __slots__ = ('name',)
+
+    def __init__(self, *items: ContentItem, name: ContentItem = '.'):
+        super().__init__(*items)
+        self.name = name
 
     def render(self, ctx: Ctx):
         ctx.put('Załącznik: ').put(self.name).put('\\hfill').put(HLine())
@@ -324,7 +608,7 @@ class Attachment(Content):
         ctx.cmd('pagebreak')
 
 
-class MeasurePageSetup(LatexObject):
+class MeasurePageSetup(LatexModel):
     ce_data: str
     firma: ContentItem = '.'
     data_pomiarow: ContentItem = '.'
@@ -353,7 +637,7 @@ class MeasurePageSetup(LatexObject):
             .put('\\fancypagestyle{FancyTitle}{\\renewcommand{\\headrulewidth}{0pt}\\fancyhead{}}')
 
 
-class MeasureTitlePage(LatexObject):
+class MeasureTitlePage(LatexModel):
     ce_data: str
     firma: ContentItem = '.'
     data_pomiarow: ContentItem = '.'
@@ -386,7 +670,7 @@ class MeasureTitlePage(LatexObject):
             .put(self.pomiarowcy)
 
 
-class MeasureDescriptionPage(LatexObject):
+class MeasureDescriptionPage(LatexModel):
     ce_data: str
 
     wykonawca: ContentItem = ('.', '.', '.', '.')
@@ -432,8 +716,12 @@ class MeasureDescriptionPage(LatexObject):
 
 
 class MeasurePlaceBlock(Center):
-    place: Tree
-    landscape: bool = False
+    __slots__ = ('place', 'landscape')
+
+    def __init__(self, *items: ContentItem, place: Tree, landscape: bool = False):
+        super().__init__(*items)
+        self.place = place
+        self.landscape = landscape
 
     def _render_table(self, ctx: Ctx):
         ctx.put(Bold(
@@ -1,17 +1,22 @@
-from collections import defaultdict
-from re import findall, split
-from typing import Tuple, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
+from re import compile
+from typing import Tuple, Dict, Any, Iterable
 
+from numpy import ndarray, full
 from pydantic import BaseModel
 from pysqlite3 import Cursor
 
 from latex_utils import LongTable, ContentItem, Bold, Center
-from sonel_sql import query_models, Tree, Measurement, MeasurementValue
+from measure_values import PropertyKeys, MeasureData, property_keys
+from sonel_db import ConnectionPool, connect_immutable
+from sonel_sql import query_tree_children, Tree
 
 
 class MeasureDescriptor(BaseModel):
     title: ContentItem = 'Pomiar'
     measure_ids: Tuple[str, ...] = ()
+    required_properties: Tuple[str, ...] = ()  # GLOB patterns of used properties, all when empty
 
     def get_description(self) -> ContentItem:
         raise NotImplementedError('get description implemented')
@@ -25,49 +30,203 @@ class MeasureDescriptor(BaseModel):
     def format_row(self, row: Dict[str, Any]) -> Tuple[ContentItem, ...]:
         raise NotImplementedError('get rows not implemented')
 
+    def compute_rows(self, columns: Dict[str, Dict[str, ndarray]]) -> Dict[str, ndarray]:
+        """
+        Optional batch version of compute_row, gets property columns of all places by measure type
+        """
+        raise NotImplementedError('compute rows not implemented')
+
+    def format_rows(self, rows: Dict[str, ndarray]) -> Tuple[ndarray, ...]:
+        """
+        Optional batch version of format_row, gets columns of computed rows (None where missing)
+        and returns columns of rendered cell strings
+        """
+        raise NotImplementedError('format rows not implemented')
+
+
+def _properties_filter(properties: Tuple[str, ...]) -> Tuple[str, Tuple[str, ...]]:
+    # patterns are bound as parameters, quotes in them can't break the query
+    if not properties:
+        return '', ()
+    patterns = " OR ".join('property GLOB ?' for _ in properties)
+    return f' AND ({patterns})', tuple(properties)
+
 
 def get_measure_data(
-        cur: Cursor, places: Tuple[Tree, ...], measure_types: Tuple[str, ...]
-):
+        cur: Cursor, places: Tuple[Tree, ...], measure_types: Tuple[str, ...],
+        properties: Tuple[str, ...] = (), keys: PropertyKeys = property_keys
+) -> MeasureData:
+    """
+    Property values of last correct measurement of each type by place,
+    rows are read without models and property names are interned in `keys`
+    """
     place_ids_list = ", ".join(map(str, (place.idNode for place in places)))
     measure_types_list = ", ".join(f'"{m}"' for m in measure_types)
     places_by_ids = {}
     for place in places:
         places_by_ids[place.idNode] = place
 
-    measurements = query_models(
-        cur, Measurement,
-        query_filter=f'idNode IN ({place_ids_list}) AND typeMeasurement IN ({measure_types_list}) AND evaluate = "Correct"',
-        order_by='dateTime ASC'
-    )
-    meas_by_ids = {}
     meas_unique = {}
-    all_data = defaultdict(lambda: defaultdict(dict))
-    for meas in measurements:
-        meas_unique[(meas.idNode, meas.typeMeasurement)] = meas.idMeasurement
-        meas_by_ids[meas.idMeasurement] = meas
-        all_data[meas.idNode][meas.typeMeasurement]['place_name'] = places_by_ids[meas.idNode].shortName
+    for meas_id, node_id, meas_type in cur.execute(
+            f'SELECT idMeasurement, idNode, typeMeasurement FROM Measurement '
+            f'WHERE idNode IN ({place_ids_list}) AND typeMeasurement IN ({measure_types_list}) AND evaluate = "Correct" '
+            f'ORDER BY dateTime ASC'
+    ):
+        meas_unique[(node_id, meas_type)] = meas_id
 
     measure_ids_list = ", ".join(map(str, meas_unique.values()))
-    measurement_values = query_models(
-        cur, MeasurementValue,
-        query_filter=f'idMeasurement IN ({measure_ids_list})',
-    )
+    place_name_id = keys.intern('place_name')
+    intern = keys.intern
+    values_by_ids = {}
+    current_id = None
+    key_ids = values = None
+    properties_filter, patterns = _properties_filter(properties)
+    for meas_id, prop, value in cur.execute(
+            f'SELECT idMeasurement, property, value FROM MeasurementValue '
+            f'WHERE idMeasurement IN ({measure_ids_list}){properties_filter} '
+            f'ORDER BY idMeasurement', patterns
+    ):
+        if meas_id != current_id:
+            current_id = meas_id
+            key_ids, values = [place_name_id], [None]
+            values_by_ids[meas_id] = (key_ids, values)
+        key_ids.append(intern(prop))
+        values.append(value)
 
-    for v in measurement_values:
-        meas = meas_by_ids[v.idMeasurement]
-        all_data[meas.idNode][meas.typeMeasurement][v.property] = v.value
+    all_data = {}
+    for (node_id, meas_type), meas_id in meas_unique.items():
+        place = places_by_ids[node_id]
+        key_ids, values = values_by_ids.get(meas_id, ([place_name_id], [None]))
+        values[0] = place.shortName
+        all_data.setdefault(node_id, {})[meas_type] = keys.values(tuple(key_ids), tuple(values))
 
     return {
-        places_by_ids[place_id].name or places_by_ids[place_id].idNode: {
-            meas_type: meas_data for meas_type, meas_data in place_data.items()
-        } for place_id, place_data in all_data.items()
+        places_by_ids[place_id].name or place_id: place_data
+        for place_id, place_data in all_data.items()
     }
 
 
+def to_columns(
+        measure_data: Dict[str, Dict[str, Dict[str, str]]], measure_types: Tuple[str, ...]
+) -> Tuple[Tuple[str, ...], Dict[str, Dict[str, ndarray]]]:
+    """
+    Place names and property columns (object arrays, None where missing) by measure type
+    """
+    place_names = tuple(measure_data)
+    columns = {meas_type: {} for meas_type in measure_types}
+    for i, place_name in enumerate(place_names):
+        for meas_type, meas_data in measure_data[place_name].items():
+            type_columns = columns.setdefault(meas_type, {})
+            for prop, value in meas_data.items():
+                if prop not in type_columns:
+                    type_columns[prop] = full(len(place_names), None, dtype=object)
+                type_columns[prop][i] = value
+    return place_names, columns
+
+
+def from_columns(place_names: Tuple[str, ...], columns: Dict[str, ndarray]) -> Dict[str, Dict[str, Any]]:
+    values = {k: col.tolist() for k, col in columns.items()}
+    return {
+        place_name: {k: col[i] for k, col in values.items()}
+        for i, place_name in enumerate(place_names)
+    }
+
+
+def compute_all_rows(
+        measure_descr: MeasureDescriptor, measure_data: Dict[str, Dict[str, Dict[str, str]]]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    compute_row for every place, in one batch when descriptor implements compute_rows
+    """
+    if not measure_data:
+        return {}
+    place_names, columns = to_columns(measure_data, measure_descr.measure_ids)
+    try:
+        rows = measure_descr.compute_rows(columns)
+    except NotImplementedError:
+        return {
+            place_name: measure_descr.compute_row(data)
+            for place_name, data in measure_data.items()
+        }
+    return from_columns(place_names, rows)
+
+
+ExtractJob = Tuple[Tuple[Tree, ...], Tuple[str, ...], Tuple[str, ...]]  # places, measure types, properties
+
+_worker_cursor = None
+
+
+def _init_extract_worker(path: str):
+    global _worker_cursor
+    _worker_cursor = connect_immutable(path).cursor()
+
+
+def _extract_in_worker(job: ExtractJob):
+    return get_measure_data(_worker_cursor, *job)
+
+
+def _extract_in_thread(pool: ConnectionPool, job: ExtractJob):
+    with pool.cursor() as cur:
+        return get_measure_data(cur, *job)
+
+
+def get_measure_data_parallel(
+        pool: ConnectionPool, jobs: Iterable[ExtractJob], processes: bool = False
+) -> Tuple[Dict[str, Dict[str, Dict[str, str]]], ...]:
+    """
+    Run get_measure_data for independent jobs on pool connections, results are in jobs order
+    """
+    jobs = tuple(jobs)
+    if processes:
+        with ProcessPoolExecutor(
+                pool.size, initializer=_init_extract_worker, initargs=(pool.path,)
+        ) as executor:
+            return tuple(executor.map(_extract_in_worker, jobs))
+    with ThreadPoolExecutor(pool.size) as executor:
+        return tuple(executor.map(lambda job: _extract_in_thread(pool, job), jobs))
+
+
+def merge_measure_data(results: Iterable[Dict[str, Dict[str, Dict[str, str]]]]):
+    """
+    Merges results of different measure types (e.g. jobs by descriptor) for the same places.
+    Place names repeat in different subtrees, results of subtrees are kept apart by get_subtrees_data,
+    ValueError when the same measure type of a place comes from more results
+    """
+    merged = {}
+    for data in results:
+        for place_name, place_data in data.items():
+            merged_place = merged.setdefault(place_name, {})
+            repeated = merged_place.keys() & place_data.keys()
+            if repeated:
+                raise ValueError(f'Measure types {", ".join(sorted(repeated))} of {place_name} in more results')
+            merged_place.update(place_data)
+    return merged
+
+
+def get_subtrees_data(
+        pool: ConnectionPool, node_ids: Iterable[int], measure_types: Tuple[str, ...],
+        processes: bool = False, properties: Tuple[str, ...] = ()
+) -> Dict[int, Dict[str, Dict[str, Dict[str, str]]]]:
+    """
+    Measure data for children of each node (e.g. circuits of each building) extracted in parallel
+    """
+    node_ids = tuple(node_ids)
+    with pool.cursor() as cur:
+        jobs = tuple(
+            (tuple(query_tree_children(cur, (node_id,))), measure_types, properties)
+            for node_id in node_ids
+        )
+    return dict(zip(node_ids, get_measure_data_parallel(pool, jobs, processes)))
+
+
+_NUMBER_RE = compile(r'\d+')
+
+
+# place names repeat in every table of the protocol, key is computed once per name
+@lru_cache(maxsize=1 << 16)
 def _sort_key(name):
-    nums = findall(r'\d+', name) + ['0']
-    parts = split(r'\d+', name)
+    nums = _NUMBER_RE.findall(name) + ['0']
+    parts = _NUMBER_RE.split(name)
     k = []
     for n, p in zip(nums, parts):
         p = p.strip()
@@ -77,16 +236,91 @@ def _sort_key(name):
     return tuple(k)
 
 
+@lru_cache(maxsize=128)
+def _sorted_place_names(names: Tuple[str, ...]) -> Tuple[str, ...]:
+    # stable sort, names with equal keys (like `Obwód 01` and `Obwód 1`) keep their order
+    return tuple(sorted(names, key=_sort_key))
+
+
+def sort_place_names(names: Iterable[str]) -> Tuple[str, ...]:
+    """
+    Natural order of place names, order of the same places is reused between tables
+    """
+    return _sorted_place_names(tuple(names))
+
+
 def _generate_measurements_rows(measure_descr: MeasureDescriptor, measure_data):
-    for place_name in sorted(measure_data, key=_sort_key):
+    for place_name in sort_place_names(measure_data):
         yield (place_name,) + measure_descr.format_row(measure_data[place_name])
 
 
+class MeasureRows:
+    """
+    Table rows formatted lazily on every iteration, can be pickled unlike generator
+    """
+    __slots__ = ('measure_descr', 'measure_data')
+
+    def __init__(self, measure_descr: MeasureDescriptor, measure_data: Dict[str, Dict[str, Any]]):
+        self.measure_descr = measure_descr
+        self.measure_data = measure_data
+
+    def __iter__(self):
+        return _generate_measurements_rows(self.measure_descr, self.measure_data)
+
+    def __getstate__(self):
+        return self.measure_descr, self.measure_data
+
+    def __setstate__(self, state):
+        self.measure_descr, self.measure_data = state
+
+
+class MeasureColumns:
+    """
+    Pre-formatted table columns computed on every iteration in chunks of `chunk_size` places,
+    like MeasureRows for descriptors with format_rows
+    """
+    __slots__ = ('measure_descr', 'measure_data', 'chunk_size')
+
+    def __init__(
+            self, measure_descr: MeasureDescriptor, measure_data: Dict[str, Dict[str, Any]],
+            chunk_size: int = 1000
+    ):
+        self.measure_descr = measure_descr
+        self.measure_data = measure_data
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        place_names = sort_place_names(self.measure_data)
+        for start in range(0, len(place_names), self.chunk_size):
+            chunk = place_names[start:start + self.chunk_size]
+            # computed rows are pivoted as the only measure type of each place
+            _, columns = to_columns(
+                {place_name: {'row': self.measure_data[place_name]} for place_name in chunk}, ('row',)
+            )
+            yield (tuple(map(str, chunk)),) + tuple(self.measure_descr.format_rows(columns['row']))
+
+    def __getstate__(self):
+        return self.measure_descr, self.measure_data, self.chunk_size
+
+    def __setstate__(self, state):
+        self.measure_descr, self.measure_data, self.chunk_size = state
+
+
+def _has_format_rows(measure_descr: MeasureDescriptor) -> bool:
+    return type(measure_descr).format_rows is not MeasureDescriptor.format_rows
+
+
 def format_measure_table(measure_descr: MeasureDescriptor, meas_data):
+    if _has_format_rows(measure_descr):
+        return LongTable(
+            caption=measure_descr.title,
+            columns=('Punkt',) + measure_descr.get_columns(),
+            formatted=MeasureColumns(measure_descr, meas_data),
+        )
     return LongTable(
         caption=measure_descr.title,
         columns=('Punkt',) + measure_descr.get_columns(),
-        rows=_generate_measurements_rows(measure_descr, meas_data),
+        rows=MeasureRows(measure_descr, meas_data),
     )
 
 
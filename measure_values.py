@@ -0,0 +1,69 @@
+from threading import Lock
+from typing import Dict, List, Tuple, Any, Mapping, Iterator
+
+
+class PropertyKeys:
+    """
+    Property names interned to small integer ids, measurements with the same set of properties share one layout
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self._layouts: Dict[Tuple[int, ...], Dict[str, int]] = {}
+        self._lock = Lock()
+
+    def intern(self, name: str) -> int:
+        key_id = self.ids.get(name)
+        if key_id is None:
+            with self._lock:  # extraction threads share the table
+                key_id = self.ids.get(name)
+                if key_id is None:
+                    key_id = len(self.names)
+                    self.names.append(name)
+                    self.ids[name] = key_id
+        return key_id
+
+    def layout(self, key_ids: Tuple[int, ...]) -> Dict[str, int]:
+        # positions of values by property name, for repeated property the last value is used
+        positions = self._layouts.get(key_ids)
+        if positions is None:
+            positions = {self.names[key_id]: i for i, key_id in enumerate(key_ids)}
+            positions = self._layouts.setdefault(key_ids, positions)
+        return positions
+
+    def values(self, key_ids: Tuple[int, ...], values: Tuple[Any, ...]) -> 'MeasureValues':
+        return MeasureValues(self.layout(key_ids), values)
+
+
+# one table for the process, property names are the same in all Sonel databases
+property_keys = PropertyKeys()
+
+
+class MeasureValues(Mapping):
+    """
+    Read only property values of one measurement, keys are kept in shared layout
+    """
+    __slots__ = ('_positions', '_values')
+
+    def __init__(self, positions: Dict[str, int], values: Tuple[Any, ...]):
+        self._positions = positions
+        self._values = values
+
+    def __getitem__(self, name: str) -> Any:
+        return self._values[self._positions[name]]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._positions)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, name) -> bool:
+        return name in self._positions
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self)!r})'
+
+
+MeasureData = Mapping[str, Mapping[str, MeasureValues]]  # by place name and measure type
@@ -1,10 +1,16 @@
-from collections import defaultdict
-from sys import stderr
-from typing import Tuple, Dict, Any
+from logging import getLogger
+from typing import Tuple, Dict, Any, Mapping, Optional
 
-from latex_utils import ContentItem, Math, MultiLine, Content, Color
+from numpy import ndarray, array, asarray, full, isnan, where, char
+
+from fuse_tables import trip_current
+from latex_utils import ContentItem, Math, MultiLine, Content, Color, CtxBuffer
 from meas_render import MeasureDescriptor
 
+log = getLogger(__name__)
+
+U0 = 230.  # V
+
 
 def format_number(v, places, max_value=None):
     if v is None:
@@ -14,14 +20,86 @@ def format_number(v, places, max_value=None):
     return '{:.{}f}'.format(round(v, places), places).replace('.', ',')
 
 
+def format_column(values, places, max_value=None) -> ndarray:
+    """
+    format_number for whole column, empty for missing (None or NaN) values
+    """
+    v = asarray(values, dtype=float)
+    missing = isnan(v)
+    formatted = char.replace(char.mod(f'%.{places}f', where(missing, 0., v)), '.', ',').astype(object)
+    if max_value:
+        formatted[v > max_value] = '> {:.{}f}'.format(round(max_value, places), places).replace('.', ',')
+    formatted[missing] = ''
+    return formatted
+
+
 POZYTYWNA = Color(color='green', text='Pozytywna')
 # POZYTYWNA = 'Pozytywna'
 NEGATYWNA = Color(color='red', text='Negatywna')
 
+# rendered once for pre-formatted table columns
+POZYTYWNA_TEX = CtxBuffer().put(POZYTYWNA).value
+NEGATYWNA_TEX = CtxBuffer().put(NEGATYWNA).value
+
+
+def _evaluation_column(ok: ndarray, *values: ndarray) -> ndarray:
+    # blank where any of evaluated values is missing (NaN), like cells of these values
+    column = where(ok, POZYTYWNA_TEX, NEGATYWNA_TEX).astype(object)
+    for v in values:
+        column[isnan(v)] = ''
+    return column
+
+
+def _row_column(rows: Dict[str, ndarray], k: str) -> ndarray:
+    # computed rows column, all None when no row has the value
+    col = rows.get(k)
+    if col is None:
+        col = full(len(next(iter(rows.values()), ())), None, dtype=object)
+    return col
+
+
+def _text_column(values: ndarray) -> ndarray:
+    return array(['' if v is None else str(v) for v in values], dtype=object)
+
+
+def _column(columns: Dict[str, ndarray], prop: str) -> ndarray:
+    # like indexing in compute_row, KeyError when any place misses the property
+    col = columns[prop]
+    if any(v is None for v in col):
+        raise KeyError(prop)
+    return col
+
+
+def _float_column(columns: Dict[str, ndarray], prop: str) -> ndarray:
+    return _column(columns, prop).astype(float)
+
+
+def _unit_column(columns: Dict[str, ndarray], prop: str, unit_len: int) -> ndarray:
+    # strips unit suffix, like `16 A` or `30 mA`
+    return array([v[:-unit_len] for v in _column(columns, prop)], dtype=float)
+
+
+# evaluation formulas, work on single values as well as on columns
+
+def evaluate_loop(Ia, Zs):
+    Za = U0 / Ia
+    Ik = U0 / Zs
+    return Za, Ik, Zs <= Za
+
+
+def evaluate_rcd_ta(trcd, ta, UB, UI):
+    return (trcd <= ta) & (UB <= UI)
+
+
+def evaluate_insulation(R_LPE, R_LN, R_a):
+    return (R_LPE >= R_a) & (R_LN >= R_a)
+
 
 class PetlaZwarciaTNS(MeasureDescriptor):
     title: str = 'Badanie ochrony przed porażeniem przez samoczynne wyłączenie'
     measure_ids: Tuple[str, ...] = ('Zln', 'ZlpeRCD')
+    required_properties: Tuple[str, ...] = ('Type', 'FuseType', 'In', 'ia.rawValue', 'zOhm.rawValue')
+    disconnection_time: Optional[float] = None  # s, Ia from fuse tables instead of meter value when set
 
     def get_description(self) -> ContentItem:
         return (
@@ -49,30 +127,82 @@ class PetlaZwarciaTNS(MeasureDescriptor):
         # rOhm = str(round(float(zln['rOhm.rawValue']), 3))
         # xl = str(round(float(zln['xL.rawValue']), 3))
         zln = data['Zln']
+        In = float(zln['In'][:-2])
         return dict(
             fuse_model=zln['Type'],
             fuse_characteristics=zln['FuseType'],
-            In=float(zln['In'][:-2]),
-            Ia=float(zln['ia.rawValue']),
+            In=In,
+            Ia=float(self._trip_current(zln['FuseType'], In, float(zln['ia.rawValue']))),
             Zs=float(zln['zOhm.rawValue']),
             # Ik=float(zln['ikA.rawValue']),
         )
 
+    def compute_rows(self, columns: Dict[str, Dict[str, ndarray]]) -> Dict[str, ndarray]:
+        zln = columns['Zln']
+        In = _unit_column(zln, 'In', 2)
+        return dict(
+            fuse_model=_column(zln, 'Type'),
+            fuse_characteristics=_column(zln, 'FuseType'),
+            In=In,
+            Ia=self._trip_current(zln['FuseType'], In, _float_column(zln, 'ia.rawValue')),
+            Zs=_float_column(zln, 'zOhm.rawValue'),
+        )
+
+    def _trip_current(self, characteristics, In, measured_Ia):
+        # table value for characteristics and rating, meter value when not in tables
+        if self.disconnection_time is None:
+            return measured_Ia
+        Ia = trip_current(characteristics, In, self.disconnection_time)
+        return where(isnan(Ia), measured_Ia, Ia)
+
     def format_row(self, row: Dict[str, Any]) -> Tuple[ContentItem, ...]:
-        Za = 230. / row['Ia']
-        Ik = 230. / row['Zs']
+        Za, Ik, ok = evaluate_loop(row['Ia'], row['Zs'])
         return (
             # row['fuse_model'],
             row['fuse_characteristics'],
             format_number(row['In'], 2), format_number(row['Ia'], 2),
             format_number(row['Zs'], 2), format_number(Za, 2),
-            format_number(Ik, 2), POZYTYWNA if row['Zs'] <= Za else NEGATYWNA
+            format_number(Ik, 2), POZYTYWNA if ok else NEGATYWNA
+        )
+
+    def format_rows(self, rows: Dict[str, ndarray]) -> Tuple[ndarray, ...]:
+        Ia, Zs = asarray(_row_column(rows, 'Ia'), dtype=float), asarray(_row_column(rows, 'Zs'), dtype=float)
+        Za, Ik, ok = evaluate_loop(Ia, Zs)
+        return (
+            _text_column(_row_column(rows, 'fuse_characteristics')),
+            format_column(_row_column(rows, 'In'), 2), format_column(Ia, 2),
+            format_column(Zs, 2), format_column(Za, 2),
+            format_column(Ik, 2), _evaluation_column(ok, Ia, Zs),
         )
 
 
+def parse_rcd_steps(meas_data: Mapping[str, str]) -> Dict[Tuple[str, str], Dict[str, str]]:
+    """
+    Correct RCDAuto step results (`results.N.key` properties) by (RCDMeasureMode, step),
+    for repeated steps the one with highest N is kept
+    """
+    results = {}
+    for k, v in meas_data.items():
+        if k.startswith('results.'):
+            _, n, kk = k.split('.', 2)
+            results.setdefault(int(n), {})[kk] = v
+
+    steps = {}
+    for n in sorted(results):
+        step = results[n]
+        if step.get('correctness') == 'Correct':
+            steps[(step.get('RCDMeasureMode'), step.get('step'))] = step
+    return steps
+
+
 class TestRCD(MeasureDescriptor):
     title: str = 'Parametry zabezpieczeń różnicowoprądowych'
     measure_ids: Tuple[str, ...] = ('RCDAuto',)
+    required_properties: Tuple[str, ...] = (
+        'RCDTypeCombo', 'deltaInCombo', 'ul.rawValue',
+        'results.*.correctness', 'results.*.RCDMeasureMode', 'results.*.step',
+        'results.*.t_a.rawValue', 'results.*.I_a.rawValue',
+    )
 
     def get_description(self) -> ContentItem:
         return (
@@ -90,14 +220,6 @@ class TestRCD(MeasureDescriptor):
             ),
         )
 
-    def _collect_results(self, meas_data):
-        results = defaultdict(dict)
-        for k, v in meas_data.items():
-            if k.startswith('results.'):
-                _, n, kk = k.split('.', 2)
-                results[int(n)][kk] = v
-        return tuple(tuple(zip(*sorted(results.items())))[1])
-
     def get_columns(self):
         return (
             MultiLine('Wyłącznik', 'RCD'),
@@ -110,25 +232,25 @@ class TestRCD(MeasureDescriptor):
 
     def compute_row(self, data: Dict[str, Dict[str, str]]) -> Dict[str, Any]:
         RCDAuto = data['RCDAuto']
-        results = self._collect_results(RCDAuto)
+        steps = parse_rcd_steps(RCDAuto)
 
         row = {}
 
-        for v in results:
-            if v['correctness'] == 'Correct' and v['RCDMeasureMode'] == 'taUbRe' and v['step'] == 'ta1+':
-                row['trcd'] = float(v['t_a.rawValue']) * 1e3
+        ta_step = steps.get(('taUbRe', 'ta1+'))
+        if ta_step is not None:
+            row['trcd'] = float(ta_step['t_a.rawValue']) * 1e3
 
-        for v in results:
-            if v['correctness'] == 'Correct' and v['RCDMeasureMode'] == 'IaUbRe' and v['step'] == 'ia+':
-                print(v, file=stderr)
-                row['Ia'] = float(v['I_a.rawValue']) * 1e3
+        ia_step = steps.get(('IaUbRe', 'ia+'))
+        if ia_step is not None:
+            log.debug('RCD ia+ step: %s', ia_step)
+            row['Ia'] = float(ia_step['I_a.rawValue']) * 1e3
 
         row.update(
             rcd_model=RCDAuto['RCDTypeCombo'],
             In_mA=float(RCDAuto['deltaInCombo'][:-3]),
             UI=float(RCDAuto['ul.rawValue']),
         )
-        print(row, file=stderr)
+        log.debug('RCD row: %s', row)
         return row
 
     def format_row(self, row: Dict[str, Any]) -> Tuple[ContentItem, ...]:
@@ -143,6 +265,9 @@ class TestRCD(MeasureDescriptor):
 class TestRCDta(MeasureDescriptor):
     title: str = 'Parametry zabezpieczeń różnicowoprądowych'
     measure_ids: Tuple[str, ...] = ('RCDta',)
+    required_properties: Tuple[str, ...] = (
+        'RCDTypeCombo', 'deltaInCombo', 't_a.rawValue', 'ul.rawValue', 'ub.rawValue', 're.rawValue',
+    )
 
     def get_description(self) -> ContentItem:
         return (
@@ -181,6 +306,18 @@ class TestRCDta(MeasureDescriptor):
             RE=float(RCDta['re.rawValue']),
         )
 
+    def compute_rows(self, columns: Dict[str, Dict[str, ndarray]]) -> Dict[str, ndarray]:
+        RCDta = columns['RCDta']
+        return dict(
+            rcd_model=_column(RCDta, 'RCDTypeCombo'),
+            In_mA=_unit_column(RCDta, 'deltaInCombo', 3),
+            ta=full(len(RCDta['RCDTypeCombo']), 40e-3),
+            trcd=_float_column(RCDta, 't_a.rawValue'),
+            UI=_float_column(RCDta, 'ul.rawValue'),
+            UB=_float_column(RCDta, 'ub.rawValue'),
+            RE=_float_column(RCDta, 're.rawValue'),
+        )
+
     def format_row(self, row: Dict[str, Any]) -> Tuple[ContentItem, ...]:
         return (
             # row['rcd_model'],
@@ -188,13 +325,24 @@ class TestRCDta(MeasureDescriptor):
             format_number(row['In_mA'], 0),
             format_number(row['ta'] * 1e3, 0), format_number(row['trcd'] * 1e3, 0),
             format_number(row['UB'], 1), format_number(row['UI'], 0),
-            POZYTYWNA if (row['trcd'] <= row['ta'] and row['UB'] <= row['UI']) else NEGATYWNA,
+            POZYTYWNA if evaluate_rcd_ta(row['trcd'], row['ta'], row['UB'], row['UI']) else NEGATYWNA,
+        )
+
+    def format_rows(self, rows: Dict[str, ndarray]) -> Tuple[ndarray, ...]:
+        trcd, ta, UB, UI = (asarray(_row_column(rows, k), dtype=float) for k in ('trcd', 'ta', 'UB', 'UI'))
+        return (
+            full(len(trcd), '[AC]', dtype=object),
+            format_column(_row_column(rows, 'In_mA'), 0),
+            format_column(ta * 1e3, 0), format_column(trcd * 1e3, 0),
+            format_column(UB, 1), format_column(UI, 0),
+            _evaluation_column(evaluate_rcd_ta(trcd, ta, UB, UI), trcd, ta, UB, UI),
         )
 
 
 class RezystancjaIzolacji(MeasureDescriptor):
     title: str = 'Rezystancja izolacji zasilenia'
     measure_ids: Tuple[str, ...] = ('RisoUniSchuko',)
+    required_properties: Tuple[str, ...] = ('R_LPE.rawValue', 'R_LN.rawValue')
 
     def get_description(self) -> ContentItem:
         return (
@@ -223,12 +371,30 @@ class RezystancjaIzolacji(MeasureDescriptor):
             R_a=250e6,
         )
 
+    def compute_rows(self, columns: Dict[str, Dict[str, ndarray]]) -> Dict[str, ndarray]:
+        RisoUniSchuko = columns['RisoUniSchuko']
+        R_LPE = _float_column(RisoUniSchuko, 'R_LPE.rawValue')
+        return dict(
+            R_LPE=R_LPE,
+            R_LN=_float_column(RisoUniSchuko, 'R_LN.rawValue'),
+            R_a=full(len(R_LPE), 250e6),
+        )
+
     def format_row(self, row: Dict[str, Any]) -> Tuple[ContentItem, ...]:
         return (
             format_number(row['R_LPE'] * 1e-6, 0, max_value=250),
             format_number(row['R_LN'] * 1e-6, 0, max_value=250),
             format_number(row['R_a'] * 1e-6, 0),
-            POZYTYWNA if (row['R_LPE'] >= row['R_a'] and row['R_LN'] >= row['R_a']) else NEGATYWNA,
+            POZYTYWNA if evaluate_insulation(row['R_LPE'], row['R_LN'], row['R_a']) else NEGATYWNA,
+        )
+
+    def format_rows(self, rows: Dict[str, ndarray]) -> Tuple[ndarray, ...]:
+        R_LPE, R_LN, R_a = (asarray(_row_column(rows, k), dtype=float) for k in ('R_LPE', 'R_LN', 'R_a'))
+        return (
+            format_column(R_LPE * 1e-6, 0, max_value=250),
+            format_column(R_LN * 1e-6, 0, max_value=250),
+            format_column(R_a * 1e-6, 0),
+            _evaluation_column(evaluate_insulation(R_LPE, R_LN, R_a), R_LPE, R_LN, R_a),
         )
 
 
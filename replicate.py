@@ -1,11 +1,15 @@
 from re import sub
-from typing import Iterable, Mapping, Dict, Any
+from typing import Iterable, Mapping, Dict, Any, Optional, Tuple
 
+from numpy import ndarray, full, empty, nan, isnan, ones, where
+from numpy.random import Generator, default_rng
 from pysqlite3 import Cursor
 
-from meas_render import MeasureDescriptor, get_measure_data
+from incremental import RowCache, compute_rows_incremental
+from meas_render import MeasureDescriptor, get_measure_data, compute_all_rows, from_columns
+from sampler_store import SamplerStore
 from sonel_sql import query_tree_children
-from value_sampler import get_samplers_for_items, sample_vals
+from value_sampler import ColumnSamplers, SamplerFit, get_column_samplers
 
 
 def name_to_pattern(name):
@@ -22,53 +26,131 @@ def fill_pattern(pattern, nums):
     )
 
 
-def fill_for_node(
+def _place_names(names: Iterable[str], extracted_data: Mapping[str, Any]) -> Tuple[str, ...]:
+    return tuple(dict.fromkeys((*names, *extracted_data.keys())))
+
+
+def fill_columns(
+        place_names: Tuple[str, ...], extracted_data: Mapping[str, Dict[str, Any]],
+        samplers: ColumnSamplers, override: Mapping = (), rng: Optional[Generator] = None
+) -> Dict[str, ndarray]:
+    """
+    Property columns for places, values missing in extracted data (absent, None or NaN) are sampled
+    and override is set for all places
+    """
+    if rng is None:
+        rng = default_rng()
+    n = len(place_names)
+    values = {k: full(n, nan) for k in samplers.numeric_names}
+    values.update((k, full(n, None, dtype=object)) for k in samplers.categories)
+    missing = {k: ones(n, dtype=bool) for k in values}
+    for i, place_name in enumerate(place_names):
+        for k, v in (extracted_data.get(place_name) or {}).items():
+            if v is None or isinstance(v, float) and isnan(v):
+                continue
+            values[k][i] = v
+            missing[k][i] = False
+
+    sampled = samplers.sample(n, rng)
+    columns = {k: where(missing[k], sampled[k], col) for k, col in values.items()}
+    for k, v in dict(override).items():
+        columns[k] = empty(n, dtype=object)
+        columns[k].fill(v)  # sequence values are set as they are, full would broadcast them
+    return columns
+
+
+def _extract_node_rows(
         cur: Cursor, node_id: int, meas: MeasureDescriptor,
-        names: Iterable[str] = (), override: Mapping = (),
-        ignore: Iterable[int] = ()
-):
-    override = dict(override)
+        ignore: Iterable[int] = (), cache: Optional[RowCache] = None
+) -> Dict[str, Dict[str, Any]]:
     ignore = set(ignore)
     children = tuple(
         c for c in query_tree_children(cur, (node_id,))
         if c.idNode not in ignore
     )
 
-    db_data = get_measure_data(cur, children, meas.measure_ids)
-    extracted_data = {
-        node_id: meas.compute_row(data)
-        for node_id, data in db_data.items()
-    }
+    if cache is not None:
+        return compute_rows_incremental(cur, cache, children, meas)
+    db_data = get_measure_data(cur, children, meas.measure_ids, meas.required_properties)
+    return compute_all_rows(meas, db_data)
 
-    samplers = get_samplers_for_items(extracted_data.values())
 
-    return {
-        place_name: {**sample_vals(
-            samplers, extracted_data.get(place_name) or {}
-        ), **override} for place_name in set(names).union(db_data.keys())
-    }
+def fill_for_node(
+        cur: Cursor, node_id: int, meas: MeasureDescriptor,
+        names: Iterable[str] = (), override: Mapping = (),
+        ignore: Iterable[int] = (), cache: Optional[RowCache] = None,
+        seed: Optional[int] = None,
+        store: Optional[SamplerStore] = None, installation: str = ''
+):
+    """
+    Values for measured places and `names`, sampled from node data,
+    stored model for descriptor and installation type is used when node has no data
+    """
+    extracted_data = _extract_node_rows(cur, node_id, meas, ignore, cache)
+
+    samplers = None
+    if not extracted_data and store is not None:
+        samplers = store.get(type(meas).__name__, installation)
+    if samplers is None:
+        samplers = get_column_samplers(extracted_data.values())
+    place_names = _place_names(names, extracted_data)
+    return from_columns(place_names, fill_columns(
+        place_names, extracted_data, samplers, override, default_rng(seed)
+    ))
 
 
 def sample_points(
         extracted_data: Dict[str, Dict[str, Any]],
-        names: Iterable[str] = ()
+        names: Iterable[str] = (), seed: Optional[int] = None
 ):
-    samplers = get_samplers_for_items(extracted_data.values())
+    samplers = get_column_samplers(extracted_data.values())
+    place_names = _place_names(names, extracted_data)
+    return from_columns(place_names, fill_columns(
+        place_names, extracted_data, samplers, rng=default_rng(seed)
+    ))
+
 
-    return {
-        place_name: sample_vals(
-            samplers, extracted_data.get(place_name) or {}
-        ) for place_name in set(names).union(extracted_data.keys())
-    }
+def fit_node_samplers(
+        cur: Cursor, node_id: int, meas: MeasureDescriptor,
+        ignore: Iterable[int] = (), chunk_size: int = 500
+) -> ColumnSamplers:
+    """
+    Samplers fitted on node data in chunks of places, rows of whole node are never kept together
+    """
+    ignore = set(ignore)
+    children = tuple(
+        c for c in query_tree_children(cur, (node_id,))
+        if c.idNode not in ignore
+    )
+    fit = SamplerFit()
+    for i in range(0, len(children), chunk_size):
+        db_data = get_measure_data(
+            cur, children[i:i + chunk_size], meas.measure_ids, meas.required_properties
+        )
+        fit.update(compute_all_rows(meas, db_data).values())
+    return fit.samplers()
+
+
+def store_node_model(
+        cur: Cursor, node_id: int, meas: MeasureDescriptor, store: SamplerStore,
+        installation: str = '', ignore: Iterable[int] = ()
+):
+    """
+    Fits samplers on node data and merges them into store model
+    """
+    store.update(type(meas).__name__, installation, fit_node_samplers(cur, node_id, meas, ignore))
 
 
 def generate_points(
-        names: Iterable[str] = (), sample_values: Iterable = ()
+        names: Iterable[str] = (), sample_values: Iterable = (), seed: Optional[int] = None,
+        samplers: Optional[ColumnSamplers] = None
 ):
-    samplers = get_samplers_for_items(sample_values)
-
-    return {
-        place_name: sample_vals(
-            samplers, {}
-        ) for place_name in set(names)
-    }
+    """
+    Values sampled for `names`, from `sample_values` or given (e.g. stored) samplers without database
+    """
+    if samplers is None:
+        samplers = get_column_samplers(sample_values)
+    place_names = _place_names(names, {})
+    return from_columns(place_names, fill_columns(
+        place_names, {}, samplers, rng=default_rng(seed)
+    ))
@@ -0,0 +1,44 @@
+from typing import Iterable, Tuple, Optional, Mapping
+
+from latex_utils import MeasurePlaceBlock, Content, ContentItem
+from meas_render import MeasureDescriptor, get_measure_data_parallel, compute_all_rows, \
+    format_measure_table, format_legend
+from sonel_db import ConnectionPool
+from sonel_sql import query_tree_node, query_tree_children
+
+
+def measure_place_blocks(
+        pool: ConnectionPool, node_ids: Iterable[int], descriptors: Iterable[MeasureDescriptor],
+        processes: bool = False, landscape: bool = False,
+        legends: Optional[Mapping[str, ContentItem]] = None
+) -> Tuple[MeasurePlaceBlock, ...]:
+    """
+    Table block with all descriptors for each node (e.g. building), data of all nodes is extracted in parallel,
+    `legends` can provide prerendered legend by descriptor class name
+    """
+    node_ids = tuple(node_ids)
+    descriptors = tuple(descriptors)
+    with pool.cursor() as cur:
+        nodes = tuple(query_tree_node(cur, node_id) for node_id in node_ids)
+        jobs = tuple(
+            (children, descr.measure_ids, descr.required_properties)
+            for children in (tuple(query_tree_children(cur, (node_id,))) for node_id in node_ids)
+            for descr in descriptors
+        )
+    data = iter(get_measure_data_parallel(pool, jobs, processes))
+
+    blocks = []
+    for node in nodes:
+        tables = []
+        for descr in descriptors:
+            rows = compute_all_rows(descr, next(data))
+            if rows:
+                if legends is not None and type(descr).__name__ in legends:
+                    legend = legends[type(descr).__name__]
+                else:
+                    legend = Content(*format_legend(descr))
+                tables.append(Content(format_measure_table(descr, rows), legend))
+        if tables:
+            blocks.append(MeasurePlaceBlock(*tables, place=node, landscape=landscape))
+    return tuple(blocks)
+
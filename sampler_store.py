@@ -0,0 +1,53 @@
+from json import load, dump
+from os import replace
+from os.path import exists
+from typing import Dict, Any, Optional
+
+from value_sampler import ColumnSamplers
+
+STORE_VERSION = 2  # 2: numeric samplers stored as count, mean, m2, min, max
+
+
+class SamplerStore:
+    """
+    Fitted sampler parameters by descriptor and installation type, kept in small json file
+    """
+
+    def __init__(self, fname: str):
+        self.fname = fname
+        self._models: Dict[str, Dict[str, Any]] = {}
+        if exists(fname):
+            with open(fname) as f:
+                data = load(f)
+            if data.get('version') != STORE_VERSION:
+                raise ValueError(f'Unsupported sampler store version {data.get("version")}')
+            self._models = data['models']
+
+    @staticmethod
+    def _key(descriptor: str, installation: str) -> str:
+        return f'{descriptor}/{installation}'
+
+    def get(self, descriptor: str, installation: str = '') -> Optional[ColumnSamplers]:
+        params = self._models.get(self._key(descriptor, installation))
+        if params is None:
+            return None
+        return ColumnSamplers.from_params(params)
+
+    def update(self, descriptor: str, installation: str, samplers: ColumnSamplers):
+        """
+        Adds fitted samplers, merged with model already stored for the same key
+        """
+        stored = self.get(descriptor, installation)
+        if stored is not None:
+            samplers = stored.merge(samplers)
+        self._models[self._key(descriptor, installation)] = samplers.params()
+
+    def merge(self, other: 'SamplerStore'):
+        for key, params in other._models.items():
+            descriptor, installation = key.split('/', 1)
+            self.update(descriptor, installation, ColumnSamplers.from_params(params))
+
+    def save(self):
+        with open(f'{self.fname}.tmp', 'w') as f:
+            dump(dict(version=STORE_VERSION, models=self._models), f, separators=(',', ':'))
+        replace(f'{self.fname}.tmp', self.fname)
@@ -0,0 +1,161 @@
+from contextlib import contextmanager
+from queue import Queue
+from sys import argv
+from time import perf_counter
+from typing import Tuple, Dict, Generator
+
+from pydantic import BaseModel
+from pysqlite3 import connect, Connection, Cursor
+
+# Sonel export comes without any indexes, all of these are used by filters in sonel_sql / meas_render
+INDEXES: Dict[str, str] = {
+    'idx_tree_parent': 'Tree(idParentNode, idNode)',
+    'idx_tree_node': 'Tree(idNode)',
+    'idx_measurement_node': 'Measurement(idNode, typeMeasurement, evaluate, dateTime, idMeasurement)',
+    'idx_measurement_value': 'MeasurementValue(idMeasurement, property, value)',
+}
+
+PRAGMAS: Dict[str, str] = {
+    'mmap_size': str(256 * 1024 * 1024),
+    'cache_size': str(-64 * 1024),  # in KiB
+    'temp_store': 'MEMORY',
+}
+
+
+class PrepareReport(BaseModel):
+    source: str
+    target: str
+    indexes: Tuple[str, ...]
+    time_before: float  # seconds
+    time_after: float
+
+    @property
+    def speedup(self) -> float:
+        return self.time_before / self.time_after if self.time_after else float('inf')
+
+    def __str__(self):
+        return (
+            f'{self.source} -> {self.target}: created {", ".join(self.indexes) or "no indexes"}; '
+            f'probe queries {self.time_before * 1e3:.1f} ms -> {self.time_after * 1e3:.1f} ms '
+            f'(x{self.speedup:.1f})'
+        )
+
+
+def set_pragmas(conn: Connection, pragmas: Dict[str, str] = PRAGMAS):
+    for k, v in pragmas.items():
+        conn.execute(f'PRAGMA {k} = {v}')
+
+
+def connect_database(path: str, read_only: bool = False) -> Connection:
+    if read_only:
+        conn = connect(f'file:{path}?mode=ro', uri=True)
+    else:
+        conn = connect(path)
+    set_pragmas(conn)
+    return conn
+
+
+def connect_immutable(path: str) -> Connection:
+    """
+    Read only connection to file that is not changed by anyone else, sqlite skips locking
+    """
+    conn = connect(f'file:{path}?mode=ro&immutable=1', uri=True, check_same_thread=False)
+    set_pragmas(conn)
+    return conn
+
+
+class ConnectionPool:
+    """
+    Read only connections to the same database shared by worker threads
+    """
+
+    def __init__(self, path: str, size: int = 4):
+        self.path = path
+        self.size = size
+        self._connections = Queue()
+        for _ in range(size):
+            self._connections.put(connect_immutable(path))
+
+    @contextmanager
+    def cursor(self) -> Generator[Cursor, None, None]:
+        conn = self._connections.get()
+        try:
+            yield conn.cursor()
+        finally:
+            self._connections.put(conn)
+
+    def close(self):
+        for _ in range(self.size):
+            self._connections.get().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _probe_queries(cur: Cursor, probe_count: int = 20) -> float:
+    """
+    Time queries shaped like the ones issued by query_tree_children and get_measure_data
+    """
+    parent_ids = tuple(r[0] for r in cur.execute(
+        f'SELECT DISTINCT idParentNode FROM Tree LIMIT {probe_count}'
+    ))
+    node_ids = tuple(r[0] for r in cur.execute(
+        f'SELECT DISTINCT idNode FROM Measurement LIMIT {probe_count}'
+    ))
+    meas_types = tuple(r[0] for r in cur.execute(
+        'SELECT DISTINCT typeMeasurement FROM Measurement'
+    ))
+    measure_types_list = ", ".join(f'"{m}"' for m in meas_types)
+
+    start = perf_counter()
+    for parent_id in parent_ids:
+        cur.execute(f'SELECT idNode, name FROM Tree WHERE idParentNode IN ({parent_id})').fetchall()
+    for node_id in node_ids:
+        meas_ids = tuple(r[0] for r in cur.execute(
+            f'SELECT idMeasurement FROM Measurement '
+            f'WHERE idNode IN ({node_id}) AND typeMeasurement IN ({measure_types_list}) AND evaluate = "Correct" '
+            f'ORDER BY dateTime ASC'
+        ))
+        if meas_ids:
+            cur.execute(
+                f'SELECT idMeasurement, property, value FROM MeasurementValue '
+                f'WHERE idMeasurement IN ({", ".join(map(str, meas_ids))})'
+            ).fetchall()
+    return perf_counter() - start
+
+
+def prepare_database(source: str, target: str) -> PrepareReport:
+    """
+    Copy Sonel export into working file and create indexes there, source file is not modified
+    """
+    src_conn = connect_database(source, read_only=True)
+    time_before = _probe_queries(src_conn.cursor())
+
+    dst_conn = connect(target)
+    src_conn.backup(dst_conn)
+    src_conn.close()
+
+    set_pragmas(dst_conn)
+    existing = set(r[0] for r in dst_conn.execute(
+        'SELECT name FROM sqlite_master WHERE type = "index"'
+    ))
+    created = tuple(name for name in INDEXES if name not in existing)
+    for name in created:
+        dst_conn.execute(f'CREATE INDEX {name} ON {INDEXES[name]}')
+    dst_conn.execute('ANALYZE')
+    dst_conn.commit()
+
+    time_after = _probe_queries(dst_conn.cursor())
+    dst_conn.close()
+
+    return PrepareReport(
+        source=source, target=target, indexes=created,
+        time_before=time_before, time_after=time_after,
+    )
+
+
+if __name__ == '__main__':
+    print(prepare_database(argv[1], argv[2]))
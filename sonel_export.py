@@ -0,0 +1,132 @@
+from argparse import ArgumentParser
+from csv import writer
+from gzip import open as gzip_open
+from os import makedirs, replace
+from os.path import join
+from typing import Tuple, Dict, Optional, Iterable
+
+from pysqlite3 import Cursor
+
+from sonel_db import connect_database
+
+MEASUREMENT_COLUMNS = ('idMeasurement', 'idNode', 'place_name', 'dateTime', 'evaluate')
+
+
+def query_measure_types(cur: Cursor) -> Tuple[str, ...]:
+    cur.execute('SELECT DISTINCT typeMeasurement FROM Measurement ORDER BY typeMeasurement')
+    return tuple(t for t, in cur.fetchall())
+
+
+def _evaluate_filter(evaluate: Optional[str]) -> str:
+    return f' AND m.evaluate = "{evaluate}"' if evaluate else ''
+
+
+def query_type_properties(cur: Cursor, measure_type: str, evaluate: Optional[str] = 'Correct') -> Tuple[str, ...]:
+    # values are streamed and deduplicated here, raw exports have no index and sqlite would join and sort
+    # all values in memory (temp_store)
+    properties = set()
+    for prop, in cur.execute(
+            f'SELECT property FROM MeasurementValue WHERE idMeasurement IN ('
+            f'SELECT m.idMeasurement FROM Measurement m WHERE m.typeMeasurement = ?{_evaluate_filter(evaluate)})',
+            (measure_type,)
+    ):
+        properties.add(prop)
+    return tuple(sorted(properties))
+
+
+def iter_type_rows(
+        cur: Cursor, measure_type: str, properties: Tuple[str, ...], evaluate: Optional[str] = 'Correct',
+        chunk_size: int = 1000
+) -> Iterable[list]:
+    """
+    Measurements of one type pivoted to rows of MEASUREMENT_COLUMNS and `properties`, '' where missing.
+    Values are read for chunks of `chunk_size` measurements, memory does not grow with database size
+    """
+    positions = {p: i for i, p in enumerate(properties, len(MEASUREMENT_COLUMNS))}
+    values_cur = cur.connection.cursor()
+    cur.execute(
+        f'SELECT m.idMeasurement, m.idNode, t.name, t.shortName, m.dateTime, m.evaluate '
+        f'FROM Measurement m '
+        f'LEFT JOIN Tree t ON t.idNode = m.idNode '
+        f'WHERE m.typeMeasurement = ?{_evaluate_filter(evaluate)}', (measure_type,)
+    )
+    while True:
+        measurements = cur.fetchmany(chunk_size)
+        if not measurements:
+            break
+        rows = {
+            meas_id: [meas_id, node_id, name or short_name, date_time, evaluated] + [''] * len(properties)
+            for meas_id, node_id, name, short_name, date_time, evaluated in measurements
+        }
+        measure_ids_list = ", ".join(map(str, rows))
+        for meas_id, prop, value in values_cur.execute(
+                f'SELECT idMeasurement, property, value FROM MeasurementValue '
+                f'WHERE idMeasurement IN ({measure_ids_list})'
+        ):
+            position = positions.get(prop)
+            if position is not None:
+                rows[meas_id][position] = value
+        yield from rows.values()
+
+
+def export_type(
+        cur: Cursor, measure_type: str, fname: str,
+        evaluate: Optional[str] = 'Correct', batch_size: int = 1000, compress: bool = True
+) -> int:
+    """
+    Writes measurements of one type to csv (gzip compressed) file, rows are written in batches
+    so memory does not grow with database size. Returns number of rows
+    """
+    properties = query_type_properties(cur, measure_type, evaluate)
+    count = 0
+    with (gzip_open if compress else open)(f'{fname}.tmp', 'wt', newline='', encoding='utf-8') as f:
+        w = writer(f)
+        w.writerow(MEASUREMENT_COLUMNS + properties)
+        batch = []
+        for row in iter_type_rows(cur, measure_type, properties, evaluate, batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                w.writerows(batch)
+                count += len(batch)
+                batch = []
+        w.writerows(batch)
+        count += len(batch)
+    replace(f'{fname}.tmp', fname)
+    return count
+
+
+def export_measurements(
+        cur: Cursor, directory: str, measure_types: Iterable[str] = (),
+        evaluate: Optional[str] = 'Correct', batch_size: int = 1000, compress: bool = True
+) -> Dict[str, int]:
+    """
+    One file per measurement type (all types when none given), returns number of rows by type
+    """
+    makedirs(directory, exist_ok=True)
+    measure_types = tuple(measure_types) or query_measure_types(cur)
+    ext = 'csv.gz' if compress else 'csv'
+    return {
+        measure_type: export_type(
+            cur, measure_type, join(directory, f'{measure_type}.{ext}'), evaluate, batch_size, compress
+        )
+        for measure_type in measure_types
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Export measurements of Sonel database to csv files by measurement type')
+    parser.add_argument('db', help='Sonel database file')
+    parser.add_argument('directory', help='output directory')
+    parser.add_argument('--types', nargs='*', default=(), help='measurement types, all by default')
+    parser.add_argument('--all', action='store_true', help='export also not correct measurements')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--no-compress', action='store_true', help='plain csv instead of csv.gz')
+    args = parser.parse_args()
+
+    cursor = connect_database(args.db, read_only=True).cursor()
+    exported = export_measurements(
+        cursor, args.directory, args.types, evaluate=None if args.all else 'Correct',
+        batch_size=args.batch_size, compress=not args.no_compress
+    )
+    for exported_type, rows_count in exported.items():
+        print(f'{exported_type}: {rows_count} rows')
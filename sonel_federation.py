@@ -0,0 +1,145 @@
+from concurrent.futures import ProcessPoolExecutor
+from os.path import basename, splitext
+from typing import Tuple, Dict, Any, Iterable, Callable, TypeVar, Type, Optional, Mapping, Union
+
+from pydantic import BaseModel
+from pysqlite3 import connect, Connection, Cursor, SQLITE_READ, SQLITE_DENY, SQLITE_OK
+
+from meas_render import MeasureDescriptor, get_measure_data, compute_all_rows
+from sonel_db import connect_immutable, set_pragmas
+from sonel_sql import query_models, Tree
+
+FEDERATED_TABLES = ('Tree', 'TreeValue', 'Measurement', 'MeasurementValue', 'Settings')
+FEDERATED_PREFIX = 'Federated'  # views are named apart from tables of a single database
+
+ResultType = TypeVar('ResultType')
+Sources = Union[Iterable[str], Mapping[str, str]]  # paths, or paths by source tag
+
+
+def source_tags(sources: Sources) -> Dict[str, str]:
+    """
+    Database paths by source tag, tags default to file names without extension
+    """
+    if isinstance(sources, Mapping):
+        return dict(sources)
+    tags = {}
+    for path in sources:
+        tag = splitext(basename(path))[0]
+        if tag in tags:
+            raise ValueError(f'Duplicate source tag {tag}, give tags explicitly')
+        tags[tag] = path
+    return tags
+
+
+def _federated_views_only(action, table, column, db_name, view_name):
+    # unqualified Sonel table names resolve to the first attached database, reads outside of views are denied
+    if action == SQLITE_READ and db_name not in ('main', 'temp') and view_name is None:
+        return SQLITE_DENY
+    return SQLITE_OK
+
+
+def open_federation(sources: Sources) -> Connection:
+    """
+    In memory connection with databases attached read only and temp views (FederatedTree, FederatedMeasurement, ...)
+    with rows of all databases and additional `source` column, for ad hoc SQL over all sites.
+    Ids are unique only together with source, so queries have to filter and join on both. Views are not named
+    as Sonel tables and attached tables can be read only through the views, id based helpers
+    (query_tree_children, get_measure_data) fail on this connection instead of mixing or picking sites,
+    use map_databases or federated_rows for them.
+    Number of databases is limited by sqlite attach limit (10 by default), use map_databases for more
+    """
+    conn = connect('file::memory:', uri=True)
+    set_pragmas(conn)
+    tags = source_tags(sources)
+    aliases = {}
+    for i, (tag, path) in enumerate(tags.items()):
+        aliases[tag] = f'src{i}'
+        conn.execute('ATTACH DATABASE ? AS ?', (f'file:{path}?mode=ro', aliases[tag]))
+
+    for table in FEDERATED_TABLES:
+        present = tuple(
+            (tag, alias) for tag, alias in aliases.items()
+            if conn.execute(
+                f'SELECT count(*) FROM {alias}.sqlite_master WHERE type = "table" AND name = ?', (table,)
+            ).fetchone()[0]
+        )
+        if not present:
+            continue
+        union = ' UNION ALL '.join(
+            f'SELECT "{tag}" AS source, * FROM {alias}.{table}' for tag, alias in present
+        )
+        conn.execute(f'CREATE TEMP VIEW {FEDERATED_PREFIX}{table} AS {union}')
+    conn.set_authorizer(_federated_views_only)
+    return conn
+
+
+def _run_in_database(path: str, query: Callable[..., ResultType], args: Tuple[Any, ...]) -> ResultType:
+    conn = connect_immutable(path)
+    try:
+        return query(conn.cursor(), *args)
+    finally:
+        conn.close()
+
+
+def map_databases(
+        query: Callable[..., ResultType], sources: Sources, *args, processes: Optional[int] = None
+) -> Dict[str, ResultType]:
+    """
+    Runs `query(cur, *args)` on every database in worker processes, results by source tag.
+    `query` and its result have to be picklable (module level function returning tuples, models, dicts)
+    """
+    tags = source_tags(sources)
+    with ProcessPoolExecutor(processes) as executor:
+        results = executor.map(
+            _run_in_database, tags.values(), (query,) * len(tags), (args,) * len(tags)
+        )
+        return dict(zip(tags, results))
+
+
+def _query_models_tuple(cur: Cursor, model: Type[BaseModel], query_filter: str, order_by: str):
+    return tuple(query_models(cur, model, query_filter, order_by))
+
+
+def federated_models(
+        sources: Sources, model: Type[BaseModel], query_filter: str = '', order_by: str = '',
+        processes: Optional[int] = None
+) -> Tuple[Tuple[str, BaseModel], ...]:
+    """
+    query_models on all databases, models tagged by source
+    """
+    results = map_databases(_query_models_tuple, sources, model, query_filter, order_by, processes=processes)
+    return tuple((tag, m) for tag, models in results.items() for m in models)
+
+
+def descriptor_rows(cur: Cursor, measure_descr: MeasureDescriptor) -> Tuple[Tuple[int, str, Dict[str, Any]], ...]:
+    """
+    Computed rows of all places with measurements of descriptor as (parent node id, place name, row),
+    places are grouped by parent node as place names repeat in different buildings
+    """
+    measure_types_list = ", ".join(f'"{m}"' for m in measure_descr.measure_ids)
+    places = tuple(query_models(
+        cur, Tree,
+        query_filter=f'idNode IN (SELECT idNode FROM Measurement WHERE typeMeasurement IN ({measure_types_list}))',
+    ))
+    by_parent = {}
+    for place in places:
+        by_parent.setdefault(place.idParentNode, []).append(place)
+
+    return tuple(
+        (parent_id, place_name, row)
+        for parent_id, children in by_parent.items()
+        for place_name, row in compute_all_rows(measure_descr, get_measure_data(
+            cur, tuple(children), measure_descr.measure_ids, measure_descr.required_properties
+        )).items()
+    )
+
+
+def federated_rows(
+        sources: Sources, measure_descr: MeasureDescriptor, processes: Optional[int] = None
+) -> Tuple[Tuple[str, int, str, Dict[str, Any]], ...]:
+    """
+    Rows of descriptor from all databases as (source, parent node id, place name, row),
+    e.g. for distribution of loop impedance over all sites
+    """
+    results = map_databases(descriptor_rows, sources, measure_descr, processes=processes)
+    return tuple((tag,) + r for tag, rows in results.items() for r in rows)
@@ -0,0 +1,191 @@
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from random import Random
+from typing import Dict, Iterable, Tuple, List
+
+from pydantic import BaseModel
+from pysqlite3 import connect
+
+# tables as exported by Sonel software, without any indexes
+SCHEMA = (
+    'CREATE TABLE Settings (property TEXT, meterModel TEXT)',
+    'CREATE TABLE Tree (idNode INTEGER, idParentNode INTEGER, typeNode INTEGER, '
+    'shortName TEXT, name TEXT, dateTime TEXT)',
+    'CREATE TABLE TreeValue (idNode INTEGER, property INTEGER, value TEXT)',
+    'CREATE TABLE Measurement (idMeasurement INTEGER, idNode INTEGER, typeMeasurement TEXT, '
+    'evaluate TEXT, dateTime TEXT)',
+    'CREATE TABLE MeasurementValue (idMeasurement INTEGER, property TEXT, value TEXT)',
+)
+
+MEASURE_TYPES = ('Zln', 'RCDta', 'RisoUniSchuko', 'RCDAuto')
+
+RCD_STEPS = (
+    ('taUbRe', 'ta05+'), ('taUbRe', 'ta05-'), ('taUbRe', 'ta1+'), ('taUbRe', 'ta1-'),
+    ('taUbRe', 'ta2+'), ('taUbRe', 'ta2-'), ('taUbRe', 'ta5+'), ('taUbRe', 'ta5-'),
+    ('IaUbRe', 'ia+'), ('IaUbRe', 'ia-'),
+)
+
+_START = datetime(2020, 1, 6, 8, 0)
+
+
+class SynthConfig(BaseModel):
+    buildings: int = 10
+    floors: int = 0  # levels between building and places, 0 - places are children of buildings
+    places: int = 20  # per building (or floor)
+    history: int = 2  # measurements of every type per place
+    measure_types: Tuple[str, ...] = MEASURE_TYPES
+    incorrect_ratio: float = 0.05  # measurements with evaluate other than Correct
+    repeated_steps: float = 0.1  # RCDAuto steps repeated after incorrect result
+    seed: int = 0
+
+
+def _zln_values(rnd: Random) -> Dict[str, str]:
+    In = rnd.choice((6, 10, 16, 16, 16, 20, 25, 32))
+    characteristics = rnd.choice('BBBCCD')
+    z = rnd.uniform(.2, 3.)
+    r = z * rnd.uniform(.85, .99)
+    return {
+        'Type': rnd.choice(('S301', 'S303', 'FAZ', 'CLS6')), 'FuseType': characteristics, 'In': f'{In} A',
+        'ia.rawValue': str(In * {'B': 5, 'C': 10, 'D': 20}[characteristics]),
+        'zOhm.rawValue': str(z), 'rOhm.rawValue': str(r), 'xL.rawValue': str((z * z - r * r) ** .5),
+        'ikA.rawValue': str(230. / z), 'Uln.rawValue': str(rnd.uniform(225., 240.)),
+        'ul.rawValue': '50', 'lead': 'L-N',
+    }
+
+
+def _rcd_common(rnd: Random) -> Dict[str, str]:
+    return {
+        'RCDTypeCombo': rnd.choice(('AC', 'AC', 'A')), 'deltaInCombo': rnd.choice(('30 mA', '30 mA', '100 mA')),
+        'ul.rawValue': '50', 'RCDKind': 'General', 'Uln.rawValue': str(rnd.uniform(225., 240.)),
+    }
+
+
+def _rcd_ta_values(rnd: Random) -> Dict[str, str]:
+    return {
+        **_rcd_common(rnd),
+        't_a.rawValue': str(rnd.uniform(.01, .045)), 'ub.rawValue': str(rnd.uniform(.2, 2.)),
+        're.rawValue': str(rnd.uniform(5., 60.)),
+    }
+
+
+def _riso_values(rnd: Random) -> Dict[str, str]:
+    return {
+        'R_LPE.rawValue': str(rnd.uniform(5e7, 1e10)), 'R_LN.rawValue': str(rnd.uniform(5e7, 1e10)),
+        'R_NPE.rawValue': str(rnd.uniform(5e7, 1e10)), 'U_iso.rawValue': '500', 'time': '60',
+    }
+
+
+def _rcd_auto_values(rnd: Random, repeated_steps: float) -> Dict[str, str]:
+    values = _rcd_common(rnd)
+    n = 0
+    for mode, step in RCD_STEPS:
+        results = ['Correct']
+        if rnd.random() < repeated_steps:
+            results.insert(0, 'Incorrect')
+        for correctness in results:
+            values.update({
+                f'results.{n}.correctness': correctness, f'results.{n}.RCDMeasureMode': mode,
+                f'results.{n}.step': step,
+                f'results.{n}.t_a.rawValue': str(rnd.uniform(.01, .03)),
+                f'results.{n}.I_a.rawValue': str(rnd.uniform(.018, .03)),
+                f'results.{n}.ub.rawValue': str(rnd.uniform(.2, 2.)),
+                f'results.{n}.re.rawValue': str(rnd.uniform(5., 60.)),
+            })
+            n += 1
+    return values
+
+
+def _measure_values(rnd: Random, measure_type: str, config: SynthConfig) -> Dict[str, str]:
+    if measure_type == 'Zln':
+        return _zln_values(rnd)
+    if measure_type == 'RCDta':
+        return _rcd_ta_values(rnd)
+    if measure_type == 'RisoUniSchuko':
+        return _riso_values(rnd)
+    if measure_type == 'RCDAuto':
+        return _rcd_auto_values(rnd, config.repeated_steps)
+    raise ValueError(f'Unknown measure type {measure_type}')
+
+
+def _date(days: float) -> str:
+    return (_START + timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _tree_rows(config: SynthConfig) -> Iterable[Tuple[int, int, int, str, str, str]]:
+    yield 1, -1, 0, 'root', 'Obiekt', _date(0)
+    node_id = 1
+    for b in range(config.buildings):
+        node_id += 1
+        parents = [node_id]
+        yield node_id, 1, 1, f'B{b + 1}', f'Budynek {b + 1}', _date(0)
+        for level in range(config.floors):
+            floors = []
+            for parent_id in parents:
+                node_id += 1
+                floors.append(node_id)
+                yield node_id, parent_id, 2 + level, f'P{level}', f'Piętro {level}', _date(0)
+            parents = floors
+        for parent_id in parents:
+            for p in range(config.places):
+                node_id += 1
+                yield node_id, parent_id, 2 + config.floors, f'O{p + 1}', f'Obwód {p + 1}', _date(0)
+
+
+def generate_database(path: str, config: SynthConfig = SynthConfig(), batch_size: int = 10000) -> Dict[str, int]:
+    """
+    Sonel schema database filled with random measurements of building circuits (places are leaf nodes),
+    returns numbers of rows by table
+    """
+    rnd = Random(config.seed)
+    conn = connect(path)
+    for statement in SCHEMA:
+        conn.execute(statement)
+    conn.execute('INSERT INTO Settings VALUES ("version", "MPI-530")')
+
+    tree = tuple(_tree_rows(config))
+    conn.executemany('INSERT INTO Tree VALUES (?, ?, ?, ?, ?, ?)', tree)
+    parents = set(row[1] for row in tree)
+    places = tuple(row[0] for row in tree if row[0] not in parents)
+
+    counts = dict(Tree=len(tree), Measurement=0, MeasurementValue=0)
+    measurements: List[Tuple] = []
+    values: List[Tuple] = []
+    meas_id = 0
+    for i, node_id in enumerate(places):
+        for h in range(config.history):
+            day = h * 365 + i * 0.01
+            for measure_type in config.measure_types:
+                meas_id += 1
+                evaluate = 'Unknown' if rnd.random() < config.incorrect_ratio else 'Correct'
+                measurements.append((meas_id, node_id, measure_type, evaluate, _date(day)))
+                values.extend(
+                    (meas_id, k, v) for k, v in _measure_values(rnd, measure_type, config).items()
+                )
+        if len(values) >= batch_size:
+            conn.executemany('INSERT INTO Measurement VALUES (?, ?, ?, ?, ?)', measurements)
+            conn.executemany('INSERT INTO MeasurementValue VALUES (?, ?, ?)', values)
+            counts['Measurement'] += len(measurements)
+            counts['MeasurementValue'] += len(values)
+            measurements, values = [], []
+    conn.executemany('INSERT INTO Measurement VALUES (?, ?, ?, ?, ?)', measurements)
+    conn.executemany('INSERT INTO MeasurementValue VALUES (?, ?, ?)', values)
+    counts['Measurement'] += len(measurements)
+    counts['MeasurementValue'] += len(values)
+    conn.commit()
+    conn.close()
+    return counts
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Generate synthetic Sonel database')
+    parser.add_argument('db', help='output database file, must not exist')
+    parser.add_argument('--buildings', type=int, default=10)
+    parser.add_argument('--floors', type=int, default=0)
+    parser.add_argument('--places', type=int, default=20)
+    parser.add_argument('--history', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(generate_database(args.db, SynthConfig(
+        buildings=args.buildings, floors=args.floors, places=args.places, history=args.history, seed=args.seed,
+    )))
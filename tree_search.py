@@ -0,0 +1,114 @@
+from argparse import ArgumentParser
+from typing import Tuple, Optional
+
+from pysqlite3 import Cursor, OperationalError
+
+from sonel_db import connect_database
+from sonel_sql import query_models, Tree
+
+# temp tables are private to the connection, so the index can be built on read only (immutable) databases too
+SEARCH_TABLES = ('TreePath', 'TreeAncestor', 'TreeSearch')
+
+
+def _has_search_index(cur: Cursor) -> bool:
+    cur.execute('SELECT count(*) FROM sqlite_temp_master WHERE name = "TreeSearch"')
+    return cur.fetchone()[0] > 0
+
+
+def build_search_index(cur: Cursor, rebuild: bool = False) -> bool:
+    """
+    Materialised node paths, ancestors of every node and name search table,
+    trigram FTS5 index is used when available. Returns True when FTS5 index was created
+    """
+    if rebuild:
+        for table in SEARCH_TABLES:
+            cur.execute(f'DROP TABLE IF EXISTS temp.{table}')
+    elif _has_search_index(cur):
+        cur.execute('SELECT sql FROM sqlite_temp_master WHERE name = "TreeSearch"')
+        return 'fts5' in cur.fetchone()[0].lower()
+
+    cur.execute(
+        'CREATE TEMP TABLE TreePath AS '
+        'WITH RECURSIVE p(idNode, path, depth) AS ('
+        '  SELECT idNode, COALESCE(NULLIF(name, ""), shortName), 0 FROM Tree WHERE idParentNode = -1'
+        '  UNION ALL'
+        '  SELECT t.idNode, p.path || " / " || COALESCE(NULLIF(t.name, ""), t.shortName), p.depth + 1'
+        '  FROM Tree t JOIN p ON t.idParentNode = p.idNode'
+        ') SELECT idNode, path, depth FROM p'
+    )
+    cur.execute('CREATE UNIQUE INDEX temp.idx_tree_path ON TreePath(idNode)')
+    cur.execute(
+        'CREATE TEMP TABLE TreeAncestor AS '
+        'WITH RECURSIVE a(idNode, idAncestor) AS ('
+        '  SELECT idNode, idParentNode FROM Tree WHERE idParentNode != -1'
+        '  UNION ALL'
+        '  SELECT a.idNode, t.idParentNode FROM a JOIN Tree t ON t.idNode = a.idAncestor'
+        '  WHERE t.idParentNode != -1'
+        ') SELECT idNode, idAncestor FROM a'
+    )
+    cur.execute('CREATE INDEX temp.idx_tree_ancestor ON TreeAncestor(idAncestor, idNode)')
+
+    try:
+        cur.execute(
+            'CREATE VIRTUAL TABLE temp.TreeSearch USING fts5(name, shortName, path, tokenize="trigram")'
+        )
+        fts = True
+    except OperationalError:  # sqlite built without FTS5, names are scanned
+        cur.execute('CREATE TEMP TABLE TreeSearch (name TEXT, shortName TEXT, path TEXT)')
+        fts = False
+    cur.execute(
+        'INSERT INTO TreeSearch (rowid, name, shortName, path) '
+        'SELECT t.idNode, t.name, t.shortName, p.path FROM Tree t JOIN TreePath p ON p.idNode = t.idNode'
+    )
+    return fts
+
+
+def search_node_ids(cur: Cursor, pattern: str, under: Optional[int] = None, column: str = 'name') -> Tuple[int, ...]:
+    """
+    Ids of nodes with `column` (name, shortName or path) matching GLOB pattern (like `Obwód 1*`),
+    only descendants of `under` when given
+    """
+    if column not in ('name', 'shortName', 'path'):
+        raise ValueError(f'Unknown search column {column}')
+    if not _has_search_index(cur):
+        build_search_index(cur)
+
+    query = f'SELECT s.rowid FROM TreeSearch s WHERE s.{column} GLOB ?'
+    params = (pattern,)
+    if under is not None:
+        query += ' AND s.rowid IN (SELECT idNode FROM TreeAncestor WHERE idAncestor = ?)'
+        params += (under,)
+    return tuple(node_id for node_id, in cur.execute(query, params))
+
+
+def search_nodes(cur: Cursor, pattern: str, under: Optional[int] = None, column: str = 'name') -> Tuple[Tree, ...]:
+    node_ids = search_node_ids(cur, pattern, under, column)
+    if not node_ids:
+        return ()
+    node_ids_list = ", ".join(map(str, node_ids))
+    return tuple(query_models(
+        cur, Tree, query_filter=f'idNode IN ({node_ids_list})', order_by='idNode'
+    ))
+
+
+def node_path(cur: Cursor, node_id: int) -> str:
+    if not _has_search_index(cur):
+        build_search_index(cur)
+    cur.execute('SELECT path FROM TreePath WHERE idNode = ?', (node_id,))
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f'Node {node_id} not found')
+    return row[0]
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Find nodes of Sonel database by name')
+    parser.add_argument('db', help='Sonel database file')
+    parser.add_argument('pattern', help='GLOB pattern, like "Obwód 1*"')
+    parser.add_argument('--under', type=int, default=None, help='search only descendants of node id')
+    parser.add_argument('--column', default='name', choices=('name', 'shortName', 'path'))
+    args = parser.parse_args()
+
+    cursor = connect_database(args.db, read_only=True).cursor()
+    for found_id in search_node_ids(cursor, args.pattern, args.under, args.column):
+        print(f'{node_path(cursor, found_id)}   id={found_id}')
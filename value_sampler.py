@@ -1,25 +1,67 @@
-from collections import defaultdict
+from collections import defaultdict, Counter
 from random import uniform, choice
-from typing import Iterable, Dict, Any
+from typing import Iterable, Dict, Any, Sequence, Optional, Tuple
+
+from numpy import ndarray, array, asarray, isnan, sqrt, clip, errstate
+from numpy.random import Generator
+
+
+class NumericStats:
+    """
+    Single pass statistics of numeric values, chunks and partial results are combined with Chan's formulas
+    """
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(
+            self, count: int = 0, mean: float = 0., m2: float = 0.,
+            v_min: float = float('inf'), v_max: float = float('-inf')
+    ):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2  # sum of squared deviations from mean
+        self.min = v_min
+        self.max = v_max
+
+    def update(self, values: Iterable[float]) -> 'NumericStats':
+        v = asarray(tuple(values) if not isinstance(values, (ndarray, list, tuple)) else values, dtype=float)
+        v = v[~isnan(v)]
+        if len(v):
+            mean = float(v.mean())
+            self._combine(len(v), mean, float(((v - mean) ** 2).sum()), float(v.min()), float(v.max()))
+        return self
+
+    def merge(self, other: 'NumericStats') -> 'NumericStats':
+        result = NumericStats(self.count, self.mean, self.m2, self.min, self.max)
+        if other.count:
+            result._combine(other.count, other.mean, other.m2, other.min, other.max)
+        return result
+
+    def _combine(self, count: int, mean: float, m2: float, v_min: float, v_max: float):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, v_min)
+        self.max = max(self.max, v_max)
+
+    def range(self) -> Tuple[float, float]:
+        # for symmetric data the same as low/high deviation used before, clipped to seen values
+        spread = sqrt(2 * self.m2) / self.count
+        # mean of constant values can differ from them by rounding, both ends are clipped
+        return (
+            min(max(self.mean - spread, self.min), self.max),
+            max(min(self.mean + spread, self.max), self.min),
+        )
+
+    def params(self) -> Tuple[int, float, float, float, float]:
+        return self.count, self.mean, self.m2, self.min, self.max
 
 
 class ValueSampler:
     def __init__(self, values):
-        n = len(values)
         if isinstance(values[0], (int, float)):
-            avg = sum(values) / n
-            vals_l = tuple((v - avg) ** 2 for v in values if v <= avg)
-            vals_h = tuple((v - avg) ** 2 for v in values if v >= avg)
-            # if not var or n == 1:
-            #     var = avg * .07
-            if vals_l:
-                self._min = avg - (sum(vals_l) ** .5 / len(vals_l))
-            else:
-                self._min = avg
-            if vals_h:
-                self._max = avg + (sum(vals_h) ** .5 / len(vals_h))
-            else:
-                self._max = avg
+            self._min, self._max = NumericStats().update(values).range()
             self._values = None
         else:
             self._values = values
@@ -49,3 +91,112 @@ def sample_vals(samplers: Dict[str, ValueSampler], vals: Dict[str, Any]):
         prop_name: vals[prop_name] if prop_name in vals else samplers[prop_name].sample()
         for prop_name in set(samplers.keys()).union(vals.keys())
     }
+
+
+class ColumnSamplers:
+    """
+    Samplers of all properties, numeric ones are sampled together from their ranges
+    """
+
+    def __init__(self, numeric: Dict[str, NumericStats], categories: Dict[str, Dict[Any, int]]):
+        self.numeric = dict(numeric)
+        self.numeric_names = tuple(numeric)
+        self.categories = {k: dict(counts) for k, counts in categories.items()}
+
+        count, mean, m2, v_min, v_max = (
+            array(col, dtype=float) for col in zip(*(s.params() for s in numeric.values()))
+        ) if numeric else (array(()),) * 5
+        with errstate(invalid='ignore', divide='ignore'):
+            spread = sqrt(2 * m2) / count
+        self._min = clip(mean - spread, v_min, v_max)
+        self._max = clip(mean + spread, v_min, v_max)
+        self._choices = {
+            k: (array(tuple(counts), dtype=object), array(tuple(counts.values()), dtype=float))
+            for k, counts in self.categories.items()
+        }
+
+    @classmethod
+    def fit(cls, columns: Dict[str, Sequence[Any]]) -> 'ColumnSamplers':
+        return SamplerFit().update_columns(columns).samplers()
+
+    @property
+    def names(self):
+        return self.numeric_names + tuple(self.categories.keys())
+
+    def params(self) -> Dict[str, Any]:
+        return dict(
+            numeric={k: s.params() for k, s in self.numeric.items()},
+            categories={k: tuple(counts.items()) for k, counts in self.categories.items()},
+        )
+
+    @classmethod
+    def from_params(cls, params: Dict[str, Any]) -> 'ColumnSamplers':
+        return cls(
+            {k: NumericStats(*v) for k, v in params['numeric'].items()},
+            {k: {value: count for value, count in counts} for k, counts in params['categories'].items()},
+        )
+
+    def merge(self, other: 'ColumnSamplers') -> 'ColumnSamplers':
+        """
+        Samplers fitted on values of both, the same as fitting all values at once
+        """
+        return SamplerFit(self.numeric, self.categories).merge(
+            SamplerFit(other.numeric, other.categories)
+        ).samplers()
+
+    def sample(self, n: int, rng: Generator) -> Dict[str, ndarray]:
+        """
+        Columns of `n` sampled values for every property, numeric ones drawn with single call
+        """
+        numeric = rng.uniform(self._min, self._max, size=(n, len(self.numeric_names)))
+        columns = {k: numeric[:, j] for j, k in enumerate(self.numeric_names)}
+        for k, (values, counts) in self._choices.items():
+            columns[k] = values[rng.choice(len(values), size=n, p=counts / counts.sum())]
+        return columns
+
+
+class SamplerFit:
+    """
+    Mergeable fit of ColumnSamplers, updated chunk by chunk without keeping values
+    """
+
+    def __init__(
+            self, numeric: Optional[Dict[str, NumericStats]] = None,
+            categories: Optional[Dict[str, Dict[Any, int]]] = None
+    ):
+        self.numeric = {k: NumericStats().merge(s) for k, s in (numeric or {}).items()}
+        self.categories = {k: Counter(counts) for k, counts in (categories or {}).items()}
+
+    def update_columns(self, columns: Dict[str, Sequence[Any]]) -> 'SamplerFit':
+        for k, col in columns.items():
+            if not len(col):
+                continue
+            if k in self.numeric or (k not in self.categories and isinstance(col[0], (int, float))):
+                self.numeric.setdefault(k, NumericStats()).update(col)
+            else:
+                self.categories.setdefault(k, Counter()).update(col)
+        return self
+
+    def update(self, items: Iterable[Dict[str, Any]]) -> 'SamplerFit':
+        vals = defaultdict(list)
+        for item in items:
+            for k, v in item.items():
+                vals[k].append(v)
+        return self.update_columns(vals)
+
+    def merge(self, other: 'SamplerFit') -> 'SamplerFit':
+        for k, s in other.numeric.items():
+            self.numeric[k] = self.numeric[k].merge(s) if k in self.numeric else NumericStats().merge(s)
+        for k, counts in other.categories.items():
+            self.categories.setdefault(k, Counter()).update(counts)
+        return self
+
+    def samplers(self) -> ColumnSamplers:
+        if not self.numeric and not self.categories:
+            raise ValueError('No data found')
+        return ColumnSamplers(self.numeric, self.categories)
+
+
+def get_column_samplers(items: Iterable[Dict[str, Any]]) -> ColumnSamplers:
+    return SamplerFit().update(items).samplers()
+